@@ -81,6 +81,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Wait for other workers' writes instead of failing with "database is locked"
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -128,3 +130,101 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Task processing
+# 'thread' runs tasks on a bounded thread pool in the web process;
+# 'queue' leaves them in the database for `python manage.py worker`
+TASK_RUNNER = os.getenv('TASK_RUNNER', 'thread')
+TASK_THREADS = int(os.getenv('TASK_THREADS', '2'))
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '4'))
+# Workers heartbeat a task's lease; tasks with expired leases are re-queued
+TASK_LEASE_SECONDS = int(os.getenv('TASK_LEASE_SECONDS', '120'))
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', '3'))
+# 'streaming' renders the video while the audio is still being synthesized;
+# 'sequential' runs one stage after another
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'sequential')
+# Progress streams (/api/events/) check the database this often when no
+# in-process update arrives, and end after EVENT_STREAM_MAX_SECONDS so the
+# browser reconnects
+EVENT_STREAM_POLL_SECONDS = float(os.getenv('EVENT_STREAM_POLL_SECONDS', '2'))
+EVENT_STREAM_MAX_SECONDS = int(os.getenv('EVENT_STREAM_MAX_SECONDS', '300'))
+# A completed task for the same URL is returned as is for this long; after
+# that the page is fetched again and the result reused only if it is unchanged
+DEDUP_FRESHNESS_SECONDS = int(os.getenv('DEDUP_FRESHNESS_SECONDS', '3600'))
+# Tasks allowed in each stage at once (per web process or worker pool)
+STAGE_CONCURRENCY = {
+    'extract': int(os.getenv('STAGE_EXTRACT_CONCURRENCY', '16')),
+    'script': int(os.getenv('STAGE_SCRIPT_CONCURRENCY', '8')),
+    'audio': int(os.getenv('STAGE_AUDIO_CONCURRENCY', '8')),
+    'render': int(os.getenv('STAGE_RENDER_CONCURRENCY', '2')),
+}
+
+# Script generation
+# 'gemini', or 'stub' for offline runs
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+LLM_BACKEND_OPTIONS = {}
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+# 'auto' scripts articles longer than SCRIPT_SECTION_CHARS section by section; 'single' or 'chunked' force a mode
+SCRIPT_MODE = os.getenv('SCRIPT_MODE', 'auto')
+SCRIPT_SECTION_CHARS = int(os.getenv('SCRIPT_SECTION_CHARS', '8000'))
+# Model calls in flight at once for one chunked script
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+# On-disk cache of generated scripts (set SCRIPT_CACHE_DIR to an empty string to disable)
+SCRIPT_CACHE_DIR = os.getenv('SCRIPT_CACHE_DIR', str(BASE_DIR / 'cache' / 'scripts'))
+SCRIPT_CACHE_MAX_BYTES = int(os.getenv('SCRIPT_CACHE_MAX_MB', '64')) * 1024 * 1024
+
+# Text to speech
+# 'edge' uses Microsoft Edge TTS; 'stub' returns silent audio offline (tests, benchmarks)
+TTS_PROVIDER = os.getenv('TTS_PROVIDER', 'edge')
+TTS_PROVIDER_OPTIONS = {}
+# Segments synthesized at the same time, and retries per failing segment
+TTS_CONCURRENCY = int(os.getenv('TTS_CONCURRENCY', '8'))
+TTS_RETRIES = int(os.getenv('TTS_RETRIES', '3'))
+# On-disk cache of synthesized segments (set TTS_CACHE_DIR to an empty string to disable)
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', str(BASE_DIR / 'cache' / 'tts'))
+TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+# Blog fetching
+# Pooled connections per host, and the on-disk cache of pages revalidated
+# with ETag / Last-Modified (set HTTP_CACHE_DIR to an empty string to disable)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+HTTP_TIMEOUT = int(os.getenv('HTTP_TIMEOUT', '30'))
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', str(BASE_DIR / 'cache' / 'http'))
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_MB', '256')) * 1024 * 1024
+# Pages are cut off after this many bytes
+HTTP_MAX_BODY_BYTES = int(os.getenv('HTTP_MAX_BODY_MB', '5')) * 1024 * 1024
+# 'density' keeps only the article body (lxml); 'soup' keeps all page text (BeautifulSoup)
+CONTENT_EXTRACTOR = os.getenv('CONTENT_EXTRACTOR', 'density')
+
+# Video rendering
+# Frame size, frame rate and encoder overrides per profile, chosen per task through /api/start/
+RENDER_PROFILES = {
+    'draft': {'width': 640, 'height': 360, 'fps': 10, 'preset': 'ultrafast', 'bitrate': '500k'},
+    'standard': {'width': 1280, 'height': 720, 'fps': 30, 'bitrate': '2500k'},
+    'full': {'width': 1920, 'height': 1080, 'fps': 30},
+}
+DEFAULT_RENDER_PROFILE = os.getenv('DEFAULT_RENDER_PROFILE', 'full')
+# Smaller profiles also encoded from the same frames as each video, e.g. VIDEO_RENDITIONS=standard,draft
+VIDEO_RENDITIONS = [name for name in os.getenv('VIDEO_RENDITIONS', '').split(',') if name]
+# Also write each video as an HLS playlist of fMP4 segments, playable while it renders
+HLS_OUTPUT = os.getenv('HLS_OUTPUT', 'false').lower() in ('1', 'true', 'yes')
+HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', '4'))
+# Worker processes used to render chunks of each video in parallel (1 = single process)
+VIDEO_RENDER_WORKERS = int(os.getenv('VIDEO_RENDER_WORKERS', '1'))
+# 'ffmpeg' pipes raw frames straight to ffmpeg; 'moviepy' uses MoviePy's clip writer
+VIDEO_ENCODER = os.getenv('VIDEO_ENCODER', 'ffmpeg')
+# 'burned' draws captions into the frames; 'soft' writes .vtt/.srt files and an mp4 text track for the
+# player to draw over the animated background, and 'still' does the same over a still image at STILL_FPS
+SUBTITLE_MODE = os.getenv('SUBTITLE_MODE', 'burned')
+STILL_FPS = int(os.getenv('STILL_FPS', '1'))
+# Background gradient plates, memory-mapped by every render process (empty string keeps them in memory)
+BACKGROUND_CACHE_DIR = os.getenv('BACKGROUND_CACHE_DIR', str(BASE_DIR / 'cache' / 'background'))
+VIDEO_ENCODER_OPTIONS = {
+    'codec': os.getenv('VIDEO_CODEC', 'libx264'),
+    'preset': os.getenv('VIDEO_PRESET', 'medium'),
+    'crf': os.getenv('VIDEO_CRF') or None,  # constant quality instead of VIDEO_BITRATE
+    'bitrate': os.getenv('VIDEO_BITRATE', '5000k'),
+    'threads': int(os.getenv('VIDEO_THREADS', '0')) or None,
+    # 'copy' muxes the MP3 as is; HLS output still gets AAC, which its players expect
+    'audio_codec': os.getenv('VIDEO_AUDIO_CODEC', 'copy'),
+}
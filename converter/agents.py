@@ -1,6 +1,16 @@
+import shutil
 import threading
-from .models import ConversionTask
-from .utils import fetch_blog_content, generate_podcast_script
+
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import checkpoints, dedup, events, jobs, subtitles
+from .models import ConversionTask, TaskLogEntry
+from .utils import SPEAKER_LINE, fetch_blog_content, generate_podcast_script
+from .rendering import PodcastFrames
+from .video import (StreamingRenderer, hls_to_mp4, join_chunks, mux_subtitles, render_video,
+                    segment_hls, write_master_playlist)
 
 class BaseAgent:
     def __init__(self, task_id):
@@ -8,14 +18,15 @@ class BaseAgent:
         self.task = ConversionTask.objects.get(id=task_id)
 
     def update_progress(self, progress, step):
-        import datetime
-        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {step}\n"
-        
         self.task.progress = progress
         self.task.current_step = step
-        self.task.logs += log_entry
-        self.task.save()
+        # Two small writes that cost the same however large the task row gets:
+        # an UPDATE of just these columns and an appended log line
+        ConversionTask.objects.filter(id=self.task_id).update(
+            progress=progress, current_step=step, version=F('version') + 1)
+        entry = TaskLogEntry.objects.create(task_id=self.task_id, message=step)
+        events.publish(self.task_id, {'progress': progress, 'current_step': step,
+                                      'log': entry.line(), 'log_id': entry.id})
 
 class ContentExtractionAgent(BaseAgent):
     def run(self):
@@ -23,6 +34,9 @@ class ContentExtractionAgent(BaseAgent):
         content = fetch_blog_content(self.task.url)
         if not content:
             raise Exception("Failed to fetch content")
+        self.task.content = content
+        self.task.content_hash = dedup.content_hash(content)
+        self.task.save(update_fields=['content', 'content_hash'])
         return content
 
 class ScriptGenerationAgent(BaseAgent):
@@ -32,16 +46,23 @@ class ScriptGenerationAgent(BaseAgent):
         if not script:
             raise Exception("Failed to generate script")
         self.task.script = script
-        self.task.save()
+        self.task.save(update_fields=['script'])
         return script
 
 import asyncio
-import edge_tts
 import os
 from django.conf import settings
+from . import mp3
+from .cache import get_cache
+from .tts import get_provider, segment_key, synthesize_segments
 
 class AudioGenerationAgent(BaseAgent):
-    def run(self, script):
+    def run(self, script, listener=None):
+        """
+        Synthesizes the script to an MP3 file. If given, `listener.add_segments(
+        segments, audio_end)` receives the timing of each stretch of segments
+        as soon as it is known, before the whole file is finished.
+        """
         self.update_progress(80, "Generating multi-speaker audio...")
         
         # Parse script into segments
@@ -52,12 +73,11 @@ class AudioGenerationAgent(BaseAgent):
             if not line:
                 continue
             
-            if line.startswith("Host A:") or line.startswith("Host A ("):
-                text = line.split(":", 1)[1].strip()
-                segments.append({"voice": "en-IN-RehaanNeural", "text": text})
-            elif line.startswith("Host B:") or line.startswith("Host B ("):
+            speaker = SPEAKER_LINE.match(line)
+            if speaker:
                 text = line.split(":", 1)[1].strip()
-                segments.append({"voice": "en-IN-KavyaNeural", "text": text})
+                voice = "en-IN-RehaanNeural" if speaker.group(1) == "A" else "en-IN-KavyaNeural"
+                segments.append({"voice": voice, "text": text})
             else:
                 # Default to Host A if no label found (or narration)
                 segments.append({"voice": "en-IN-RehaanNeural", "text": line})
@@ -69,73 +89,117 @@ class AudioGenerationAgent(BaseAgent):
         # Ensure media directory exists
         os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
 
+        provider = get_provider(getattr(settings, 'TTS_PROVIDER', 'edge'),
+                                **getattr(settings, 'TTS_PROVIDER_OPTIONS', {}))
+
         async def generate_audio():
             from asgiref.sync import sync_to_async
             
-            temp_files = []
+            parts = []
             timing_data = []
             current_time = 0.0
             
-            # Need to import AudioFileClip here or at top level
-            try:
-                from moviepy import AudioFileClip
-            except ImportError:
-                from moviepy.editor import AudioFileClip
-
+            indexed = []
             for i, seg in enumerate(segments):
                 if not seg['text']: 
                     print(f"Skipping empty segment {i}")
                     continue
-                
-                print(f"Generating segment {i}: {seg['voice']} - '{seg['text'][:50]}...'")
-                temp_file = os.path.join(settings.MEDIA_ROOT, f"temp_{self.task_id}_{i}.mp3")
-                
-                try:
-                    communicate = edge_tts.Communicate(seg['text'], seg['voice'])
-                    await communicate.save(temp_file)
-                    temp_files.append(temp_file)
+                indexed.append((i, seg))
+            
+            # Cached segments skip both synthesis and the duration probe
+            cache = None
+            cached = {}
+            if getattr(settings, 'TTS_CACHE_DIR', None):
+                cache = get_cache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES)
+                for i, seg in indexed:
+                    entry = cache.get(segment_key(provider, seg['text'], seg['voice']))
+                    if entry:
+                        cached[i] = entry
+            
+            # Segments are added to the timeline in script order, as soon as
+            # every segment before them is ready; `listener` is told about each
+            # newly timed stretch so it can start working on it
+            ready = dict(cached)
+            position = 0
+
+            def advance():
+                nonlocal position, current_time
+                added = []
+                while position < len(indexed) and indexed[position][0] in ready:
+                    i, seg = indexed[position]
+                    position += 1
+                    if i in cached:
+                        audio, meta = cached[i]
+                        duration = meta['duration']
+                        print(f"Cached segment {i}: {seg['voice']} - '{seg['text'][:50]}...'")
+                    else:
+                        audio = ready[i]
+                        duration = None
+                        if isinstance(audio, Exception):
+                            print(f"Error generating segment {i}: {audio}")
+                            # Continue to next segment instead of failing everything
+                            continue
+                        print(f"Generated segment {i}: {seg['voice']} - '{seg['text'][:50]}...'")
                     
-                    # Get duration
-                    try:
-                        clip = AudioFileClip(temp_file)
-                        duration = clip.duration
-                        clip.close()
+                    # Get duration from the MP3 frame headers; frames are played back to
+                    # back once concatenated, so their full length is the segment's slot
+                    if duration is None:
+                        try:
+                            duration = mp3.probe(audio).duration
+                        except Exception as e:
+                            print(f"Error getting duration for segment {i}: {e}")
+                            continue
                         
-                        timing_data.append({
-                            'start': current_time,
-                            'end': current_time + duration,
-                            'text': seg['text'],
-                            'speaker': "Host A" if seg['voice'] == "en-IN-RehaanNeural" else "Host B"
-                        })
-                        current_time += duration
-                    except Exception as e:
-                        print(f"Error getting duration for segment {i}: {e}")
-                        
-                except Exception as e:
-                    print(f"Error generating segment {i}: {e}")
-                    # Continue to next segment instead of failing everything
-                    continue
+                        if cache:
+                            cache.set(segment_key(provider, seg['text'], seg['voice']), audio,
+                                      {'duration': duration})
+                    
+                    parts.append(audio)
+                    added.append({
+                        'start': current_time,
+                        'end': current_time + duration,
+                        'text': seg['text'],
+                        'speaker': "Host A" if seg['voice'] == "en-IN-RehaanNeural" else "Host B"
+                    })
+                    current_time += duration
+                
+                timing_data.extend(added)
+                if listener and added:
+                    listener.add_segments(added, current_time)
+
+            pending = [(i, seg) for i, seg in indexed if i not in cached]
+
+            def on_result(n, audio):
+                ready[pending[n][0]] = audio
+                advance()
+
+            # Synthesize the rest concurrently
+            advance()
+            await synthesize_segments(
+                provider, [seg for _, seg in pending],
+                concurrency=getattr(settings, 'TTS_CONCURRENCY', 8),
+                retries=getattr(settings, 'TTS_RETRIES', 3),
+                on_result=on_result,
+            )
+            
+            if cache:
+                print(f"TTS cache: {len(cached)} of {len(indexed)} segments cached, "
+                      f"hit rate {cache.hits / max(1, cache.hits + cache.misses):.0%}")
             
-            if not temp_files:
+            if not parts:
                 raise Exception("No audio segments were successfully generated.")
 
             # Save timing map using sync_to_async
             @sync_to_async
             def save_timing_map():
                 self.task.timing_map = timing_data
-                self.task.save()
+                self.task.save(update_fields=['timing_map'])
             
             await save_timing_map()
 
-            # Concatenate files
-            with open(output_path, 'wb') as outfile:
-                for temp_file in temp_files:
-                    try:
-                        with open(temp_file, 'rb') as infile:
-                            outfile.write(infile.read())
-                        os.remove(temp_file) # Clean up temp file
-                    except Exception as e:
-                        print(f"Error merging file {temp_file}: {e}")
+            # Join the segments' audio frames in memory order under a single header,
+            # so the file's duration matches the timing map
+            mp3.concatenate(output_path, parts)
 
         try:
             asyncio.run(generate_audio())
@@ -143,27 +207,171 @@ class AudioGenerationAgent(BaseAgent):
             raise Exception(f"Failed to generate audio: {str(e)}")
 
         self.task.audio_file = output_file
-        self.task.save()
+        self.task.save(update_fields=['audio_file'])
         return output_file
 
+def video_only_path(path):
+    return f"{os.path.splitext(path)[0]}_video.mp4"
+
+
+class PlaylistWatcher(threading.Thread):
+    """
+    Background thread that publishes a task's HLS playlist as soon as the
+    media playlist `ready_file` has been written, i.e. once the first
+    segment can be played.
+    """
+
+    def __init__(self, task_id, playlist_file, ready_file=None):
+        super().__init__(daemon=True)
+        self.task_id = task_id
+        self.playlist_file = playlist_file
+        self.ready_file = ready_file or playlist_file
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            path = os.path.join(settings.MEDIA_ROOT, self.ready_file)
+            while not self._stopped.wait(0.5):
+                if os.path.exists(path):
+                    ConversionTask.objects.filter(id=self.task_id).update(
+                        hls_playlist=self.playlist_file, version=F('version') + 1)
+                    events.publish(self.task_id, {'hls_playlist': self.playlist_file})
+                    return
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
 class VideoGenerationAgent(BaseAgent):
+    def frame_options(self):
+        """
+        PodcastFrames options, frame rate and encoder options for the task's
+        render profile and SUBTITLE_MODE: 'burned' draws the captions into the
+        frames, 'soft' leaves them to the player over the animated background,
+        and 'still' over a still image at STILL_FPS.
+        """
+        mode = getattr(settings, 'SUBTITLE_MODE', 'burned')
+        if mode not in ('burned', 'soft', 'still'):
+            raise ValueError(f"Unknown subtitle mode: {mode}")
+        profiles = getattr(settings, 'RENDER_PROFILES', {})
+        if self.task.render_profile not in profiles:
+            raise ValueError(f"Unknown render profile: {self.task.render_profile}")
+        encoder_options = {**getattr(settings, 'VIDEO_ENCODER_OPTIONS', {}),
+                           **profiles[self.task.render_profile]}
+        options = {
+            'width': encoder_options.pop('width', 1920),
+            'height': encoder_options.pop('height', 1080),
+            'captions': mode == 'burned',
+            'animated': mode != 'still',
+            'background_cache': getattr(settings, 'BACKGROUND_CACHE_DIR', None),
+        }
+        fps = encoder_options.pop('fps', 30)
+        if mode == 'still':
+            fps = getattr(settings, 'STILL_FPS', 1)
+        return options, fps, encoder_options
+
+    def renditions(self, options, fps, encoder_options):
+        """
+        Extra outputs for the VIDEO_RENDITIONS profiles smaller than the
+        task's own, keyed by profile name. They are encoded from the same
+        frames as the main video, in the same pass.
+        """
+        profiles = getattr(settings, 'RENDER_PROFILES', {})
+        renditions = {}
+        for name in getattr(settings, 'VIDEO_RENDITIONS', []):
+            if name not in profiles:
+                raise ValueError(f"Unknown render profile: {name}")
+            profile = profiles[name]
+            if profile['height'] >= options['height']:
+                continue
+            renditions[name] = {
+                **encoder_options, **profile,
+                'fps': min(profile.get('fps', fps), fps),
+                'path': os.path.join(settings.MEDIA_ROOT, f"podcast_{self.task_id}_{name}.mp4"),
+            }
+        return renditions
+
+    def reset_playlist(self):
+        """
+        Clears the task's HLS output for a new render and returns the
+        playlist's file name, or None if HLS_OUTPUT is off.
+        """
+        self.task.hls_playlist = None
+        ConversionTask.objects.filter(id=self.task_id).update(hls_playlist=None, version=F('version') + 1)
+        if not getattr(settings, 'HLS_OUTPUT', False):
+            return None
+        directory = os.path.join(settings.MEDIA_ROOT, f"podcast_{self.task_id}_hls")
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        return f"podcast_{self.task_id}_hls/index.m3u8"
+
+    def hls_captions(self, playlist_file, segments, duration, intro_duration=2, bitrate=None):
+        """
+        Adds `segments` to the task's HLS output as a WebVTT subtitle
+        rendition and returns the master playlist offering it, which is the
+        file players should load.
+        """
+        playlist_path = os.path.join(settings.MEDIA_ROOT, playlist_file)
+        captions_path = subtitles.write_hls_captions(segments, os.path.dirname(playlist_path), duration,
+                                                     offset=intro_duration)
+        master_path = write_master_playlist(playlist_path, captions_path, bitrate)
+        return os.path.relpath(master_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+    def write_subtitles(self, segments, intro_duration=2):
+        """
+        Writes `segments` as WebVTT and SRT files next to the task's video and
+        muxes them into it and its renditions as a text track. Captions can
+        be corrected this way without rendering the video again.
+        """
+        video_path = os.path.join(settings.MEDIA_ROOT, self.task.video_file)
+        vtt_path, srt_path = subtitles.write_sidecars(segments, video_path, offset=intro_duration)
+        for video_file in [self.task.video_file, *self.task.renditions.values()]:
+            mux_subtitles(os.path.join(settings.MEDIA_ROOT, video_file), srt_path)
+        self.task.subtitle_file = os.path.basename(vtt_path)
+        return self.task.subtitle_file
+
+    def own_video(self):
+        """
+        Copies the task's video and renditions to its own file names if
+        another task uses the same files, as results reused before reused
+        media was copied do, so changing them leaves the other task alone.
+        """
+        shared = ConversionTask.objects.filter(video_file=self.task.video_file).exclude(id=self.task_id)
+        if not shared.exists():
+            return
+        copies = {f"podcast_{self.task_id}.mp4": self.task.video_file}
+        renditions = {name: f"podcast_{self.task_id}_{name}.mp4" for name in self.task.renditions}
+        copies.update({renditions[name]: video_file for name, video_file in self.task.renditions.items()})
+        for copy, video_file in copies.items():
+            shutil.copyfile(os.path.join(settings.MEDIA_ROOT, video_file), os.path.join(settings.MEDIA_ROOT, copy))
+        self.task.video_file = f"podcast_{self.task_id}.mp4"
+        self.task.renditions = renditions
+
+    def update_subtitles(self):
+        """
+        Rewrites the captions of a finished task from its timing map (see
+        `write_subtitles`) and refreshes its video checkpoint.
+        """
+        self.own_video()
+        subtitle_file = self.write_subtitles(self.task.timing_map)
+        self.task.save(update_fields=['video_file', 'renditions', 'subtitle_file'])
+        # The video file changed, so its checkpoint has to follow
+        checkpoints.record(self.task_id, 'video')
+        return subtitle_file
+
     def run(self, audio_file):
         self.update_progress(90, "Generating video with captions...")
         
-        try:
-            from moviepy import AudioFileClip, ColorClip, CompositeVideoClip, TextClip
-        except ImportError:
-            # Fallback to old import style
-            from moviepy.editor import AudioFileClip, ColorClip, CompositeVideoClip, TextClip
-        
         audio_path = os.path.join(settings.MEDIA_ROOT, audio_file)
         output_file = f"podcast_{self.task_id}.mp4"
         output_path = os.path.join(settings.MEDIA_ROOT, output_file)
         
         try:
             # Load audio
-            audio_clip = AudioFileClip(audio_path)
-            duration = audio_clip.duration
+            duration = mp3.probe_file(audio_path).duration
             
             # Parse script for subtitles
             # Use timing map if available, otherwise fallback to estimation (or just empty)
@@ -202,267 +410,244 @@ class VideoGenerationAgent(BaseAgent):
                         })
                         current_time += segment_duration
             
-            # Create animated gradient background with particles
-            def make_frame(t):
-                import numpy as np
-                import math
-                # Create a gradient that shifts over time
-                w, h = 1920, 1080
-                frame = np.zeros((h, w, 3), dtype=np.uint8)
-                
-                # Animated gradient from dark blue to purple
-                for y in range(h):
-                    progress = (y / h + t / 10) % 1.0
-                    r = int(15 + progress * 100)
-                    g = int(23 + progress * 50)
-                    b = int(42 + progress * 180)
-                    frame[y, :] = [r, g, b]
-                
-                # Add pulsing circles
-                pulse = abs(math.sin(t * 2))
-                circle_radius = int(200 + pulse * 100)
-                
-                # Draw multiple pulsing circles
-                for cx, cy in [(480, 270), (1440, 270), (960, 810)]:
-                    for radius in range(circle_radius, circle_radius + 50, 10):
-                        alpha = 1 - (radius - circle_radius) / 50
-                        for angle in range(0, 360, 5):
-                            x = int(cx + radius * math.cos(math.radians(angle)))
-                            y = int(cy + radius * math.sin(math.radians(angle)))
-                            if 0 <= x < w and 0 <= y < h:
-                                frame[y, x] = [
-                                    min(255, int(frame[y, x, 0] + 60 * alpha)),
-                                    min(255, int(frame[y, x, 1] + 100 * alpha)),
-                                    min(255, int(frame[y, x, 2] + 200 * alpha))
-                                ]
-                
-                # Add floating particles
-                num_particles = 30
-                for i in range(num_particles):
-                    particle_t = (t + i * 2) % 20
-                    px = int((w / num_particles * i + particle_t * 50) % w)
-                    py = int((h / 2 + math.sin(t + i) * 300))
-                    if 0 <= px < w and 0 <= py < h:
-                        for dx in range(-3, 4):
-                            for dy in range(-3, 4):
-                                if 0 <= px + dx < w and 0 <= py + dy < h:
-                                    if dx*dx + dy*dy <= 9:
-                                        frame[py + dy, px + dx] = [200, 200, 255]
-                
-                return frame
-            
-            from moviepy import VideoClip
-            background = VideoClip(make_frame, duration=duration)
-            
-            # Create video with text burned into frames
+            # Create video, with text burned into frames unless the player shows it
             intro_duration = 2  # 2 seconds blank intro
             outro_duration = 2  # 2 seconds blank outro
-            content_duration = duration - intro_duration - outro_duration
+            options, fps, encoder_options = self.frame_options()
+            renditions = self.renditions(options, fps, encoder_options)
+            frames = PodcastFrames(subtitle_segments, duration,
+                                   intro_duration=intro_duration,
+                                   outro_duration=outro_duration,
+                                   **options)
             
-            def make_video_frame(t):
-                import numpy as np
-                import math
-                from PIL import Image, ImageDraw, ImageFont
-                
-                w, h = 1920, 1080
-                
-                # Show blank screen during intro and outro
-                if t < intro_duration or t >= (intro_duration + content_duration):
-                    # Black screen
-                    frame = np.zeros((h, w, 3), dtype=np.uint8)
-                    return frame
-                
-                # Adjust time for content (subtract intro duration)
-                content_t = t - intro_duration
-                
-                # Create a gradient that shifts over time
-                frame = np.zeros((h, w, 3), dtype=np.uint8)
-                
-                # Animated gradient from dark blue to purple
-                for y in range(h):
-                    progress = (y / h + content_t / 10) % 1.0
-                    r = int(15 + progress * 100)
-                    g = int(23 + progress * 50)
-                    b = int(42 + progress * 180)
-                    frame[y, :] = [r, g, b]
-                
-                # Add pulsing circles
-                pulse = abs(math.sin(content_t * 2))
-                circle_radius = int(200 + pulse * 100)
-                
-                # Draw multiple pulsing circles
-                for cx, cy in [(480, 270), (1440, 270), (960, 810)]:
-                    for radius in range(circle_radius, circle_radius + 50, 10):
-                        alpha = 1 - (radius - circle_radius) / 50
-                        for angle in range(0, 360, 5):
-                            x = int(cx + radius * math.cos(math.radians(angle)))
-                            y = int(cy + radius * math.sin(math.radians(angle)))
-                            if 0 <= x < w and 0 <= y < h:
-                                frame[y, x] = [
-                                    min(255, int(frame[y, x, 0] + 60 * alpha)),
-                                    min(255, int(frame[y, x, 1] + 100 * alpha)),
-                                    min(255, int(frame[y, x, 2] + 200 * alpha))
-                                ]
-                
-                # Add floating particles
-                num_particles = 30
-                for i in range(num_particles):
-                    particle_t = (content_t + i * 2) % 20
-                    px = int((w / num_particles * i + particle_t * 50) % w)
-                    py = int((h / 2 + math.sin(content_t + i) * 300))
-                    if 0 <= px < w and 0 <= py < h:
-                        for dx in range(-3, 4):
-                            for dy in range(-3, 4):
-                                if 0 <= px + dx < w and 0 <= py + dy < h:
-                                    if dx*dx + dy*dy <= 9:
-                                        frame[py + dy, px + dx] = [200, 200, 255]
-                
-                # Convert to PIL Image for text rendering
-                img = Image.fromarray(frame)
-                draw = ImageDraw.Draw(img)
-                
+            encoder = getattr(settings, 'VIDEO_ENCODER', 'ffmpeg')
+            workers = getattr(settings, 'VIDEO_RENDER_WORKERS', 1)
+            segment_seconds = getattr(settings, 'HLS_SEGMENT_SECONDS', 4)
+            playlist_file = self.reset_playlist()
+            published_file = playlist_file
+            if playlist_file and not frames.captions:
+                # The captions are known up front, so players get them from the first segment
+                published_file = self.hls_captions(playlist_file, subtitle_segments, frames.duration,
+                                                   intro_duration, encoder_options.get('bitrate'))
+            if playlist_file and encoder == 'ffmpeg':
+                # Write the playlist while rendering so playback can start with the
+                # first segment (or, in parallel, the first chunk)
+                playlist_path = os.path.join(settings.MEDIA_ROOT, playlist_file)
+                watcher = PlaylistWatcher(self.task_id, published_file, playlist_file)
+                watcher.start()
                 try:
-                    # Try to use a nice font
-                    title_font = ImageFont.truetype("arial.ttf", 50)
-                    live_font = ImageFont.truetype("arialbd.ttf", 35)
-                    bullet_font = ImageFont.truetype("arialbd.ttf", 45)
-                    speaker_font = ImageFont.truetype("arialbd.ttf", 38)
-                except:
-                    # Fallback to default font
-                    title_font = ImageFont.load_default()
-                    live_font = ImageFont.load_default()
-                    bullet_font = ImageFont.load_default()
-                    speaker_font = ImageFont.load_default()
-                
-                # Draw title with background
-                title_text = "Graffiti - AI Podcast"
-                title_bbox = draw.textbbox((0, 0), title_text, font=title_font)
-                title_width = title_bbox[2] - title_bbox[0]
-                title_x = (w - title_width) // 2
-                # Background rectangle
-                draw.rectangle([title_x - 20, 20, title_x + title_width + 20, 100], fill=(0, 0, 0, 180))
-                draw.text((title_x, 30), title_text, fill=(255, 255, 255), font=title_font)
-                
-                # Draw LIVE indicator
-                draw.rectangle([20, 20, 180, 80], fill=(0, 0, 0, 200))
-                draw.text((30, 30), "● LIVE", fill=(239, 68, 68), font=live_font)
-                
-                # Find and draw current subtitle (adjust timing for intro)
-                for segment in subtitle_segments:
-                    # Adjust segment times to account for intro
-                    adjusted_start = segment['start'] + intro_duration
-                    adjusted_end = segment['end'] + intro_duration
-                    
-                    if adjusted_start <= t < adjusted_end:
-                        # Speaker color
-                        if segment['speaker'] == 'Host A':
-                            color = (96, 165, 250)  # Light blue
-                            icon = "🎙️"
-                        else:
-                            color = (192, 132, 252)  # Light purple
-                            icon = "🎤"
-                        
-                        # Draw speaker label background
-                        speaker_text = f"{icon} {segment['speaker']}"
-                        draw.rectangle([80, 680, 400, 740], fill=(0, 0, 0, 230))
-                        draw.text((100, 690), speaker_text, fill=(255, 255, 255), font=speaker_font)
-                        
-                        # Draw bullet point background
-                        bullet_text = f"• {segment['text']}"
-                        # Word wrap
-                        if len(bullet_text) > 70:
-                            words = bullet_text.split()
-                            lines = []
-                            current_line = "• "
-                            for word in words[1:]:
-                                if len(current_line + word) > 70:
-                                    lines.append(current_line.strip())
-                                    current_line = "  " + word + " "
-                                else:
-                                    current_line += word + " "
-                            if current_line.strip():
-                                lines.append(current_line.strip())
-                            bullet_text = '\n'.join(lines[:2])  # Max 2 lines
-                        
-                        # Background for bullet
-                        draw.rectangle([80, 760, w - 80, 950], fill=(15, 23, 42, 240))
-                        
-                        # Draw bullet text
-                        y_offset = 780
-                        for line in bullet_text.split('\n'):
-                            draw.text((100, y_offset), line, fill=color, font=bullet_font)
-                            y_offset += 60
-                        
-                        break
-                
-                return np.array(img)
-            
-            from moviepy import VideoClip
-            video = VideoClip(make_video_frame, duration=duration)
-            
-            # Add audio (offset by intro duration)
-            audio_with_silence = audio_clip.with_start(intro_duration)
-            video = video.with_audio(audio_with_silence)
-            
-            # Write video file
-            video.write_videofile(output_path, fps=30, codec='libx264', 
-                                 audio_codec='aac', bitrate='5000k',
-                                 temp_audiofile=os.path.join(settings.MEDIA_ROOT, f'temp_audio_{self.task_id}.m4a'),
-                                 remove_temp=True, logger=None)
+                    if workers == 1:
+                        # Encode straight to HLS, then join the segments into the mp4 without re-encoding
+                        render_video(frames, audio_path, playlist_path, fps=fps, encoder=encoder,
+                                     renditions=list(renditions.values()), hls_segment_seconds=segment_seconds,
+                                     **encoder_options)
+                        hls_to_mp4(playlist_path, output_path)
+                    else:
+                        render_video(frames, audio_path, output_path, fps=fps, encoder=encoder, workers=workers,
+                                     renditions=list(renditions.values()), hls_playlist=playlist_path,
+                                     hls_segment_seconds=segment_seconds, **encoder_options)
+                finally:
+                    watcher.stop()
+            else:
+                render_video(frames, audio_path, output_path, fps=fps, encoder=encoder, workers=workers,
+                             renditions=list(renditions.values()), **encoder_options)
+                if playlist_file:
+                    segment_hls(output_path, os.path.join(settings.MEDIA_ROOT, playlist_file), segment_seconds,
+                                source_audio_codec=encoder_options.get('audio_codec', 'copy'))
             
-            # Close clips
-            audio_clip.close()
-            video.close()
+            self.task.video_file = output_file
+            self.task.hls_playlist = published_file
+            self.task.renditions = {name: os.path.basename(rendition['path'])
+                                    for name, rendition in renditions.items()}
+            self.task.subtitle_file = None
+            if not frames.captions:
+                self.write_subtitles(subtitle_segments, intro_duration)
             
         except Exception as e:
             raise Exception(f"Failed to generate video: {str(e)}")
         
-        self.task.video_file = output_file
-        self.task.save()
+        self.task.save(update_fields=['video_file', 'renditions', 'subtitle_file', 'hls_playlist'])
+        return output_file
+
+    def start_streaming(self):
+        """
+        Starts rendering the video in the background; pass the returned renderer
+        to AudioGenerationAgent.run as its listener, then call finish_streaming.
+        """
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        options, fps, encoder_options = self.frame_options()
+        # Video-only files, muxed with the audio into the final ones by finish_streaming
+        renditions = [{**rendition, 'path': video_only_path(rendition['path'])}
+                      for rendition in self.renditions(options, fps, encoder_options).values()]
+        frames = PodcastFrames([], float('inf'), intro_duration=2, outro_duration=2, **options)
+        return StreamingRenderer(frames, os.path.join(settings.MEDIA_ROOT, f"podcast_{self.task_id}_video.mp4"),
+                                 fps=fps, renditions=renditions, **encoder_options)
+
+    def finish_streaming(self, renderer, audio_file):
+        self.update_progress(90, "Finishing video with captions...")
+        
+        audio_path = os.path.join(settings.MEDIA_ROOT, audio_file)
+        output_file = f"podcast_{self.task_id}.mp4"
+        output_path = os.path.join(settings.MEDIA_ROOT, output_file)
+        
+        options, fps, encoder_options = self.frame_options()
+        renditions = self.renditions(options, fps, encoder_options)
+        outputs = [(renderer.output_path, output_path)]
+        outputs += [(video_only_path(rendition['path']), rendition['path']) for rendition in renditions.values()]
+        
+        try:
+            duration = mp3.probe_file(audio_path).duration
+            renderer.finish(duration)
+            # Mux the audio into the already encoded videos without re-encoding them
+            for video_path, path in outputs:
+                join_chunks([video_path], audio_path, path, renderer.rendered / renderer.fps,
+                            audio_offset=renderer.frames.intro_duration,
+                            **getattr(settings, 'VIDEO_ENCODER_OPTIONS', {}))
+            self.task.video_file = output_file
+            self.task.renditions = {name: os.path.basename(rendition['path'])
+                                    for name, rendition in renditions.items()}
+            self.task.subtitle_file = None
+            if not renderer.frames.captions:
+                self.write_subtitles(renderer.frames.segments, renderer.frames.intro_duration)
+            # The video was encoded without its audio, so it is only segmented once muxed
+            playlist_file = self.reset_playlist()
+            if playlist_file:
+                segment_hls(output_path, os.path.join(settings.MEDIA_ROOT, playlist_file),
+                            getattr(settings, 'HLS_SEGMENT_SECONDS', 4),
+                            source_audio_codec=encoder_options.get('audio_codec', 'copy'))
+                if not renderer.frames.captions:
+                    playlist_file = self.hls_captions(playlist_file, renderer.frames.segments,
+                                                      renderer.rendered / renderer.fps,
+                                                      renderer.frames.intro_duration, encoder_options.get('bitrate'))
+                self.task.hls_playlist = playlist_file
+        except Exception as e:
+            raise Exception(f"Failed to generate video: {str(e)}")
+        finally:
+            for video_path, _ in outputs:
+                if os.path.exists(video_path):
+                    os.remove(video_path)
+        
+        self.task.save(update_fields=['video_file', 'renditions', 'subtitle_file', 'hls_playlist'])
         return output_file
 
 
 class Orchestrator:
-    def __init__(self, task_id):
+    def __init__(self, task_id, worker_id=None, lease_lost=None):
         self.task_id = task_id
+        # Set when a queue worker's lease on the task runs out (see jobs.Heartbeat)
+        self.worker_id = worker_id
+        self.lease_lost = lease_lost or threading.Event()
 
     def start(self):
-        thread = threading.Thread(target=self._process)
-        thread.start()
+        jobs.enqueue(self.task_id)
+
+    def _task(self):
+        return ConversionTask.objects.get(id=self.task_id)
+
+    def _check_lease(self, stage):
+        if self.lease_lost.is_set():
+            raise jobs.LeaseLost(f"Stopped before the {stage} stage: the task was handed to another worker")
+
+    def _finish(self, **fields):
+        """
+        Writes the task's final state. Returns False, writing nothing, if the
+        worker running it has lost the task to another one.
+        """
+        tasks = ConversionTask.objects.filter(id=self.task_id)
+        if self.worker_id is not None:
+            tasks = tasks.filter(status='PROCESSING', claimed_by=self.worker_id)
+        return tasks.update(version=F('version') + 1, **fields) == 1
+
+    def _resumable(self, stage):
+        self._check_lease(stage)
+        task = self._task()
+        if not checkpoints.is_valid(task, stage):
+            return False
+        BaseAgent(self.task_id).update_progress(task.progress, f"Reusing saved {stage} output")
+        return True
 
     def _process(self):
         try:
             task = ConversionTask.objects.get(id=self.task_id)
             task.status = 'PROCESSING'
-            task.save()
+            task.save(update_fields=['status'])
+            events.publish(self.task_id, {'status': 'PROCESSING'})
+
+            # Each stage waits for a free slot under its own concurrency limit.
+            # Stages whose checkpoint is still valid (e.g. on a retry) are skipped.
 
             # Agent 1: Extract
-            extractor = ContentExtractionAgent(self.task_id)
-            content = extractor.run()
+            if self._resumable('extract'):
+                content = self._task().content
+            else:
+                with jobs.stage_slot('extract'):
+                    extractor = ContentExtractionAgent(self.task_id)
+                    content = extractor.run()
+                checkpoints.record(self.task_id, 'extract')
+                # The same content was converted before: take its results instead
+                if not self._task().regenerate:
+                    source = dedup.reuse_result(self.task_id)
+                    if source:
+                        BaseAgent(self.task_id).update_progress(
+                            20, f"Content unchanged, reusing the result of task {source.id}")
 
             # Agent 2: Script
-            writer = ScriptGenerationAgent(self.task_id)
-            script = writer.run(content)
+            if self._resumable('script'):
+                script = self._task().script
+            else:
+                with jobs.stage_slot('script'):
+                    writer = ScriptGenerationAgent(self.task_id)
+                    script = writer.run(content)
+                checkpoints.record(self.task_id, 'script')
+            events.publish(self.task_id, {'script': script})
 
             # Agent 3: Audio
-            audio_gen = AudioGenerationAgent(self.task_id)
-            audio_file = audio_gen.run(script)
+            video_done = False
+            if self._resumable('audio'):
+                audio_file = self._task().audio_file
+            elif getattr(settings, 'PIPELINE_MODE', 'sequential') == 'streaming':
+                # Render the video for segments already synthesized while later
+                # ones are still being generated, then mux the two at the end
+                with jobs.stage_slot('audio'), jobs.stage_slot('render'):
+                    video_gen = VideoGenerationAgent(self.task_id)
+                    renderer = video_gen.start_streaming()
+                    try:
+                        audio_gen = AudioGenerationAgent(self.task_id)
+                        audio_file = audio_gen.run(script, listener=renderer)
+                    except Exception:
+                        renderer.abort()
+                        raise
+                    checkpoints.record(self.task_id, 'audio')
+                    video_gen.finish_streaming(renderer, audio_file)
+                checkpoints.record(self.task_id, 'video')
+                video_done = True
+            else:
+                with jobs.stage_slot('audio'):
+                    audio_gen = AudioGenerationAgent(self.task_id)
+                    audio_file = audio_gen.run(script)
+                checkpoints.record(self.task_id, 'audio')
 
             # Agent 4: Video
-            video_gen = VideoGenerationAgent(self.task_id)
-            video_gen.run(audio_file)
+            if not video_done and not self._resumable('video'):
+                with jobs.stage_slot('render'):
+                    video_gen = VideoGenerationAgent(self.task_id)
+                    video_gen.run(audio_file)
+                checkpoints.record(self.task_id, 'video')
 
             # Complete
-            # Refetch task to ensure we don't overwrite fields saved by agents
-            task = ConversionTask.objects.get(id=self.task_id)
-            task.progress = 100
-            task.current_step = "Completed"
-            task.status = 'COMPLETED'
-            task.save()
+            # Only the columns set here, so fields saved by agents are kept
+            self._check_lease('completion')
+            if not self._finish(progress=100, current_step="Completed", status='COMPLETED',
+                                completed_at=timezone.now()):
+                raise jobs.LeaseLost("Finished after the task was handed to another worker")
+            events.publish(self.task_id, {'status': 'COMPLETED', 'progress': 100, 'current_step': "Completed"})
 
+        except jobs.LeaseLost as e:
+            # The worker that took the task over owns its status from now on
+            jobs.log_line(self.task_id, str(e))
         except Exception as e:
             import traceback
-            task = ConversionTask.objects.get(id=self.task_id)
-            task.status = 'FAILED'
-            task.error_message = f"{str(e)}\n{traceback.format_exc()}"
-            task.save()
+            if self._finish(status='FAILED', error_message=f"{str(e)}\n{traceback.format_exc()}"):
+                events.publish(self.task_id, {'status': 'FAILED'})
+            else:
+                jobs.log_line(self.task_id, f"Failed after the task was handed to another worker: {e}")
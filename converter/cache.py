@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_key(*parts):
+    """
+    Content-addressed key for any JSON-serializable parts.
+    """
+    encoded = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    A size-bounded on-disk cache of byte blobs with JSON metadata.
+
+    Each entry is one file, written atomically, so several processes can
+    share a directory. Reads refresh the file's mtime and eviction removes
+    the least recently used entries once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """
+        Returns (data, meta) for `key`, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                (header_length,) = struct.unpack('>I', f.read(4))
+                meta = json.loads(f.read(header_length))
+                data = f.read()
+            os.utime(path)
+        except (OSError, ValueError, struct.error):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data, meta
+
+    def set(self, key, data, meta=None):
+        header = json.dumps(meta or {}).encode('utf-8')
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack('>I', len(header)))
+                f.write(header)
+                f.write(data)
+            # An entry written again for the same key replaces the old file
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += 4 + len(header) + len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat
+
+    def _scan_size(self):
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def _evict(self):
+        # Drop least recently used entries until we are back under 90% of the limit
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        size = sum(stat.st_size for _, stat in entries)
+        target = self.max_bytes * 0.9
+        for path, stat in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= stat.st_size
+        self._size = size
+
+    def stats(self):
+        entries = list(self._entries())
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(entries),
+            'bytes': sum(stat.st_size for _, stat in entries),
+        }
+
+
+def get_cache(directory, max_bytes):
+    """
+    Returns the process-wide cache for `directory`, so counters accumulate across jobs.
+    """
+    with _caches_lock:
+        cache = _caches.get(str(directory))
+        if cache is None:
+            cache = _caches[str(directory)] = DiskCache(directory, max_bytes)
+        return cache
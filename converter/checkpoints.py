@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import jobs
+from .models import ACTIVE_STATUSES, ConversionTask
+
+# Pipeline stages in order; each one consumes the output of the one before
+STAGES = ['extract', 'script', 'audio', 'video']
+
+
+def _hash_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _hash_file(filename):
+    if not filename:
+        return None
+    path = os.path.join(settings.MEDIA_ROOT, filename)
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def output_hash(task, stage):
+    """
+    Hash of what `stage` currently has saved on the task, or None if its
+    output is missing.
+    """
+    if stage == 'extract':
+        return _hash_text(task.content) if task.content else None
+    if stage == 'script':
+        return _hash_text(task.script) if task.script else None
+    if stage == 'audio':
+        audio_hash = _hash_file(task.audio_file)
+        if not audio_hash or not task.timing_map:
+            return None
+        return _hash_text(audio_hash + json.dumps(task.timing_map, sort_keys=True))
+    if stage == 'video':
+        return _hash_file(task.video_file)
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def _input_hash(task, stage):
+    index = STAGES.index(stage)
+    if index == 0:
+        return _hash_text(task.url)
+    return task.checkpoints.get(STAGES[index - 1], {}).get('hash')
+
+
+def is_valid(task, stage):
+    """
+    True if the checkpoint for `stage` exists, its saved output is unchanged,
+    and it was built from the current output of the stage before it.
+    """
+    checkpoint = task.checkpoints.get(stage)
+    if not checkpoint or checkpoint['hash'] is None:
+        return False
+    return (checkpoint['hash'] == output_hash(task, stage)
+            and checkpoint['input'] == _input_hash(task, stage))
+
+
+def record(task_id, stage):
+    """
+    Saves a checkpoint for the output `stage` just wrote to the task.
+    """
+    task = ConversionTask.objects.get(id=task_id)
+    task.checkpoints[stage] = {
+        'hash': output_hash(task, stage),
+        'input': _input_hash(task, stage),
+        'at': timezone.now().isoformat(),
+    }
+    task.save(update_fields=['checkpoints'])
+
+
+def first_invalid_stage(task):
+    """
+    The stage a retry of `task` would restart from, or None if all are valid.
+    """
+    for stage in STAGES:
+        if not is_valid(task, stage):
+            return stage
+    return None
+
+
+def prepare_retry(task_id, from_stage=None, profile=None):
+    """
+    Resets a finished, failed or abandoned (see jobs.is_stale) task so it can
+    be run again. Stages with a valid checkpoint are reused unless
+    `from_stage` forces a restart there. A new render `profile` re-renders
+    the video from the saved audio.
+    """
+    task = ConversionTask.objects.get(id=task_id)
+    if task.status in ACTIVE_STATUSES and not jobs.is_stale(task):
+        raise ValueError(f"Task is already {task.status.lower()}")
+
+    if profile is not None and profile != task.render_profile:
+        if profile not in getattr(settings, 'RENDER_PROFILES', {}):
+            raise ValueError(f"Unknown render profile: {profile}")
+        task.render_profile = profile
+        if from_stage is None:
+            from_stage = 'video'
+
+    if from_stage is not None:
+        if from_stage not in STAGES:
+            raise ValueError(f"Unknown stage: {from_stage}")
+        for stage in STAGES[STAGES.index(from_stage):]:
+            task.checkpoints.pop(stage, None)
+
+    task.status = 'PENDING'
+    task.progress = 0
+    task.current_step = "Queued for retry"
+    task.error_message = None
+    task.attempts = 0  # a fresh run gets the full TASK_MAX_ATTEMPTS
+    # A worker still holding an expired lease loses the task at its next heartbeat
+    task.claimed_by = None
+    task.lease_expires_at = None
+    try:
+        with transaction.atomic():
+            task.save(update_fields=['checkpoints', 'render_profile', 'status', 'progress', 'current_step',
+                                     'error_message', 'attempts', 'claimed_by', 'lease_expires_at'])
+    except IntegrityError:
+        raise ValueError("Another task for this post and render profile is already running")
+    return task
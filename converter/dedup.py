@@ -0,0 +1,149 @@
+import hashlib
+import os
+import shutil
+from datetime import timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import jobs
+from .models import ACTIVE_STATUSES, ConversionTask
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ref', 'ref_src'}
+
+
+def normalize_url(url):
+    """
+    Canonical form of a blog URL, so trivially different links to the same
+    post coalesce: lowercase host, no default port, fragment, tracking
+    parameters or trailing slash, and sorted query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key not in TRACKING_PARAMS and not key.startswith('utm_'))
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _media_exists(task):
+    return all(name and os.path.exists(os.path.join(settings.MEDIA_ROOT, name))
+               for name in (task.audio_file, task.video_file))
+
+
+def _running(normalized, profile):
+    return ConversionTask.objects.filter(normalized_url=normalized, render_profile=profile,
+                                         status__in=ACTIVE_STATUSES).order_by('-created_at').first()
+
+
+def find_or_create(url, force=False, profile='full'):
+    """
+    Returns (task, reused) for a conversion request. Joins a task already
+    running for the same normalized URL and render profile, or unless
+    `force` is set, returns one completed within DEDUP_FRESHNESS_SECONDS;
+    otherwise creates a task.
+
+    The database allows one running task per URL and profile (see
+    ConversionTask.Meta), so when web processes race to create it the
+    losers join the winner's task. A running task whose worker is gone is
+    re-queued and joined, or failed and replaced when `force` is set.
+    """
+    normalized = normalize_url(url)
+    while True:
+        task = _running(normalized, profile)
+        if task is not None and jobs.is_stale(task):
+            status = jobs.requeue_stale(task, force=force)
+            if status != 'PENDING':
+                continue
+            task.refresh_from_db()
+            jobs.enqueue(task.id)
+        if task is None and not force:
+            fresh_since = timezone.now() - timedelta(seconds=getattr(settings, 'DEDUP_FRESHNESS_SECONDS', 3600))
+            task = next((candidate for candidate in ConversionTask.objects.filter(
+                normalized_url=normalized, render_profile=profile, status='COMPLETED',
+                completed_at__gte=fresh_since,
+            ).order_by('-completed_at')[:5] if _media_exists(candidate)), None)
+        if task is not None:
+            return task, True
+        try:
+            with transaction.atomic():
+                return ConversionTask.objects.create(url=url, normalized_url=normalized, regenerate=force,
+                                                     render_profile=profile), False
+        except IntegrityError:
+            continue
+
+
+def _own_name(name, source, task):
+    prefix = f"podcast_{source.id}"
+    if name.startswith(prefix):
+        return f"podcast_{task.id}{name[len(prefix):]}"
+    return f"podcast_{task.id}_{name}"
+
+
+def _copy_media(name, source, task):
+    """
+    Copies one of `source`'s media files (or its HLS directory, for a
+    playlist) to a name of `task`'s own and returns that name. Later
+    renders, retries and caption updates of either task then leave the
+    other's files alone; hard links would not, as ffmpeg rewrites its
+    output files in place.
+    """
+    src = os.path.join(settings.MEDIA_ROOT, name or '')
+    if not name or not os.path.exists(src):
+        return None
+    copy = _own_name(name, source, task)
+    dst = os.path.join(settings.MEDIA_ROOT, copy)
+    if os.path.dirname(name):
+        shutil.rmtree(os.path.dirname(dst), ignore_errors=True)
+        shutil.copytree(os.path.dirname(src), os.path.dirname(dst))
+    else:
+        shutil.copyfile(src, dst)
+    return copy
+
+
+def reuse_result(task_id):
+    """
+    Copies the outputs and checkpoints of a completed task whose extracted
+    content is identical, so the remaining stages validate and are skipped.
+    Media files are copied under the task's own names (see `_copy_media`).
+    The video is only taken from a task with the same render profile.
+    Returns that task, or None if there is none.
+    """
+    task = ConversionTask.objects.get(id=task_id)
+    if not task.content_hash:
+        return None
+    source = next((candidate for candidate in ConversionTask.objects.filter(
+        content_hash=task.content_hash, status='COMPLETED',
+    ).exclude(id=task.id).order_by('-completed_at')[:5] if _media_exists(candidate)), None)
+    if source is None:
+        return None
+
+    task.script = source.script
+    task.audio_file = _copy_media(source.audio_file, source, task)
+    task.timing_map = source.timing_map
+    stages = ['script', 'audio']
+    if source.render_profile == task.render_profile:
+        task.video_file = _copy_media(source.video_file, source, task)
+        task.subtitle_file = _copy_media(source.subtitle_file, source, task)
+        if source.subtitle_file:
+            _copy_media(f"{os.path.splitext(source.subtitle_file)[0]}.srt", source, task)
+        task.renditions = {name: _copy_media(video_file, source, task)
+                           for name, video_file in source.renditions.items()}
+        task.hls_playlist = _copy_media(source.hls_playlist, source, task)
+        stages.append('video')
+    for stage in stages:
+        if stage in source.checkpoints:
+            task.checkpoints[stage] = source.checkpoints[stage]
+    task.save(update_fields=['script', 'audio_file', 'video_file', 'subtitle_file', 'renditions', 'hls_playlist',
+                             'timing_map', 'checkpoints'])
+    return source
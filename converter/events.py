@@ -0,0 +1,127 @@
+import json
+import queue
+import threading
+import time
+
+from .models import ConversionTask, TaskLogEntry
+
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+
+_subscribers = {}
+_lock = threading.Lock()
+
+
+class Subscription:
+    """
+    A queue of the events published for one task while it is open.
+    """
+
+    def __init__(self, task_id):
+        self.task_id = str(task_id)
+        self.queue = queue.Queue()
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        with _lock:
+            subscribers = _subscribers.get(self.task_id)
+            if subscribers is not None:
+                subscribers.discard(self)
+                if not subscribers:
+                    del _subscribers[self.task_id]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def subscribe(task_id):
+    subscription = Subscription(task_id)
+    with _lock:
+        _subscribers.setdefault(subscription.task_id, set()).add(subscription)
+    return subscription
+
+
+def publish(task_id, event):
+    """
+    Hands `event` (a dict of changed task fields) to every open subscription
+    for the task in this process. Never blocks.
+    """
+    with _lock:
+        subscribers = list(_subscribers.get(str(task_id), ()))
+    for subscription in subscribers:
+        subscription.queue.put(event)
+
+
+def _load(task_id, after_log_id):
+    """
+    Reads the task's progress and any log lines after `after_log_id` from the
+    database, for the first event and for tasks run by another process.
+    """
+    state = ConversionTask.objects.filter(id=task_id).values(
+        'status', 'progress', 'current_step', 'hls_playlist').first()
+    if state is None:
+        return None
+    entries = list(TaskLogEntry.objects.filter(task_id=task_id, id__gt=after_log_id).order_by('id'))
+    if entries:
+        state['log'] = ''.join(entry.line() for entry in entries)
+        state['log_id'] = entries[-1].id
+    return state
+
+
+def _message(event, data, event_id=None):
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def task_stream(task_id, last_log_id=0, poll_interval=2, max_seconds=300):
+    """
+    Server-Sent Events for a task: `progress` events carrying only the fields
+    that changed and new log lines, then a `done` event with the results.
+
+    Events published in this process arrive immediately; when none arrive
+    for `poll_interval` seconds the database is checked, which covers tasks
+    run by a worker process. The stream ends after `max_seconds` and the
+    browser reconnects, resuming after the last log line it received.
+    """
+    deadline = time.monotonic() + max_seconds
+    sent = {}
+
+    with subscribe(task_id) as subscription:
+        event = _load(task_id, last_log_id)
+        while True:
+            delta = {}
+            if event:
+                for field in ('status', 'progress', 'current_step', 'script', 'hls_playlist'):
+                    if field in event and sent.get(field) != event[field]:
+                        delta[field] = sent[field] = event[field]
+                # Lines already read from the database may be published again
+                if event.get('log') and event['log_id'] > last_log_id:
+                    delta['log'] = event['log']
+                    last_log_id = event['log_id']
+
+            if delta:
+                yield _message('progress', delta, last_log_id or None)
+
+            if sent.get('status') in TERMINAL_STATUSES:
+                result = ConversionTask.objects.filter(id=task_id).values(
+                    'status', 'progress', 'current_step', 'script', 'audio_file', 'video_file',
+                    'subtitle_file', 'renditions', 'hls_playlist', 'render_profile',
+                    'error_message').first()
+                yield _message('done', result, last_log_id or None)
+                return
+
+            if time.monotonic() >= deadline:
+                return
+            event = subscription.get(poll_interval)
+            if event is None:
+                event = _load(task_id, last_log_id)
+                yield ": keep-alive\n\n"
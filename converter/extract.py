@@ -0,0 +1,158 @@
+import re
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+
+# Elements that never hold article text
+DROP_TAGS = ['script', 'style', 'noscript', 'iframe', 'svg', 'form', 'button', 'input', 'select',
+             'nav', 'header', 'footer', 'aside', 'template']
+# class/id fragments of navigation, comment sections, share bars and the like
+BOILERPLATE = re.compile(
+    r'comment|footer|sidebar|widget|\bnav|menu|breadcrumb|share|social|related|promo|'
+    r'advert|\bads?\b|cookie|newsletter|subscribe|signup|popup|modal|banner|masthead',
+    re.I)
+# ...unless they also look like the content itself
+MAYBE_CONTENT = re.compile(r'article|content|main|post|entry|body|story', re.I)
+TEXT_TAGS = {'p', 'pre', 'blockquote', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'td', 'dd'}
+
+# A density result shorter than this is treated as a failed extraction
+MIN_ARTICLE_LENGTH = 200
+
+
+def extract_soup(html):
+    """
+    All visible text of the page, one line per text chunk. Slow, but copes
+    with any markup; used as the fallback.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.decompose()
+
+    # Get text
+    text = soup.get_text()
+
+    # Break into lines and remove leading/trailing space on each
+    lines = (line.strip() for line in text.splitlines())
+    # Break multi-headlines into a line each
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    # Drop blank lines
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+
+def _clean(text):
+    return ' '.join(text.split())
+
+
+def _is_boilerplate(element):
+    if element.tag in ('html', 'body', 'article', 'main'):
+        return False
+    names = f"{element.get('class', '')} {element.get('id', '')} {element.get('role', '')}"
+    return bool(BOILERPLATE.search(names)) and not MAYBE_CONTENT.search(names)
+
+
+def _link_density(element):
+    text_length = len(_clean(element.text_content())) or 1
+    link_length = sum(len(_clean(link.text_content())) for link in element.iter('a'))
+    return min(1.0, link_length / text_length)
+
+
+def _nested(child, root):
+    """
+    True if `child` is inside another text block below `root` (e.g. a p in an li).
+    """
+    if child is root:
+        return False
+    for ancestor in child.iterancestors():
+        if ancestor is root:
+            return False
+        if ancestor.tag in TEXT_TAGS:
+            return True
+    return False
+
+
+def _blocks(element):
+    """
+    Text of the outermost text blocks under `element`, in document order.
+    """
+    lines = []
+    for child in element.iter(*TEXT_TAGS):
+        if _nested(child, element):
+            continue
+        text = _clean(child.text_content())
+        if text and _link_density(child) < 0.5:
+            lines.append(text)
+    return lines
+
+
+def extract_density(html):
+    """
+    Main article text, found by scoring containers on the paragraphs they
+    hold: long, comma-rich paragraphs with few links add to their parent's
+    and grandparent's score, and the best container's text blocks are kept.
+    Navigation, footers, comments and other boilerplate are removed first.
+    """
+    import lxml.html
+
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    document = lxml.html.fromstring(html)
+    title = next(document.iter('h1'), None)
+    headline = _clean(title.text_content()) if title is not None else ''
+
+    for element in list(document.iter(*DROP_TAGS)):
+        element.drop_tree()
+    for element in list(document.iter()):
+        if isinstance(element.tag, str) and element.getparent() is not None and _is_boilerplate(element):
+            element.drop_tree()
+
+    scores = {}
+    for paragraph in document.iter('p', 'pre', 'blockquote', 'td'):
+        text = _clean(paragraph.text_content())
+        if len(text) < 25:
+            continue
+        score = (1 + text.count(',') + min(len(text) // 100, 3)) * (1 - _link_density(paragraph))
+        parent = paragraph.getparent()
+        if parent is None:
+            continue
+        scores[parent] = scores.get(parent, 0) + score
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0) + score / 2
+
+    if not scores:
+        return ''
+    best = max(scores, key=scores.get)
+
+    lines = _blocks(best)
+    # Keep the headline when it sits outside the article body
+    if headline and headline not in lines:
+        lines.insert(0, headline)
+    return '\n'.join(lines)
+
+
+EXTRACTORS = {
+    'density': extract_density,
+    'soup': extract_soup,
+}
+
+
+def extract_text(html, extractor=None):
+    """
+    Extracts the article text from `html` with the configured extractor,
+    falling back to BeautifulSoup if it is unavailable or finds too little.
+    """
+    name = extractor or getattr(settings, 'CONTENT_EXTRACTOR', 'density')
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown content extractor: {name}")
+    if name != 'soup':
+        try:
+            text = EXTRACTORS[name](html)
+            if len(text) >= MIN_ARTICLE_LENGTH:
+                return text
+            print(f"{name} extractor found only {len(text)} characters, falling back to BeautifulSoup")
+        except Exception as e:
+            # e.g. lxml not installed, or markup it cannot parse
+            print(f"{name} extractor failed ({e}), falling back to BeautifulSoup")
+    return extract_soup(html)
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import cache_key, get_cache
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    The process-wide session, so connections (and TLS handshakes) are reused
+    across jobs and threads.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = getattr(settings, 'HTTP_POOL_SIZE', 10)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                  max_retries=Retry(total=2, backoff_factor=0.5,
+                                                    status_forcelist=[502, 503, 504]))
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def _max_age(headers):
+    """
+    Seconds the response may be used without revalidating, or None if it
+    must not be stored at all.
+    """
+    directives = {}
+    for directive in headers.get('Cache-Control', '').lower().split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name] = value
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    try:
+        return int(directives.get('max-age', 0))
+    except ValueError:
+        return 0
+
+
+def _read_body(response, max_bytes):
+    """
+    Streams the body, stopping once `max_bytes` have been read.
+    Returns (body, truncated).
+    """
+    body = bytearray()
+    for chunk in response.iter_content(64 * 1024):
+        body += chunk
+        if len(body) > max_bytes:
+            return bytes(body[:max_bytes]), True
+    return bytes(body), False
+
+
+def fetch(url, timeout=None):
+    """
+    GETs `url` through the shared session and the on-disk response cache,
+    returning the body as bytes.
+
+    Cached responses are used as is while their max-age lasts and are
+    revalidated with If-None-Match / If-Modified-Since after that, so an
+    unchanged page costs a 304 instead of a download. Bodies larger than
+    HTTP_MAX_BODY_BYTES are cut off there and not cached.
+    """
+    timeout = timeout or getattr(settings, 'HTTP_TIMEOUT', 30)
+    max_bytes = getattr(settings, 'HTTP_MAX_BODY_BYTES', 5 * 1024 * 1024)
+    cache = None
+    if getattr(settings, 'HTTP_CACHE_DIR', None):
+        cache = get_cache(settings.HTTP_CACHE_DIR, settings.HTTP_CACHE_MAX_BYTES)
+    key = cache_key('http', url)
+
+    cached = cache.get(key) if cache else None
+    headers = {}
+    if cached:
+        body, meta = cached
+        if time.time() < meta['fetched_at'] + meta['max_age']:
+            print(f"HTTP cache: fresh copy of {url}")
+            return body
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    with get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if cached and response.status_code == 304:
+            print(f"HTTP cache: {url} not modified")
+            meta['fetched_at'] = time.time()
+            meta['max_age'] = _max_age(response.headers) or meta['max_age']
+            cache.set(key, body, meta)
+            return body
+
+        response.raise_for_status()
+        declared = int(response.headers.get('Content-Length') or 0)
+        if declared > max_bytes:
+            print(f"Response of {declared} bytes from {url} exceeds the limit; reading the first {max_bytes}")
+        body, truncated = _read_body(response, max_bytes)
+
+        max_age = _max_age(response.headers)
+        validators = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        if cache and not truncated and max_age is not None and (validators or max_age):
+            cache.set(key, body, {
+                'fetched_at': time.time(),
+                'max_age': max_age,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            })
+        return body
@@ -0,0 +1,290 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import events
+from .models import ConversionTask, TaskLogEntry
+
+_stage_semaphores = None
+_stage_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+# Tasks waiting or running on this process's thread pool
+_submitted = set()
+
+
+def install_stage_semaphores(semaphores):
+    """
+    Replaces the per-stage limits, e.g. with semaphores shared by a pool of
+    worker processes.
+    """
+    global _stage_semaphores
+    _stage_semaphores = semaphores
+
+
+def _semaphores():
+    global _stage_semaphores
+    with _stage_lock:
+        if _stage_semaphores is None:
+            limits = getattr(settings, 'STAGE_CONCURRENCY', {})
+            _stage_semaphores = {stage: threading.BoundedSemaphore(limit) for stage, limit in limits.items()}
+        return _stage_semaphores
+
+
+@contextmanager
+def stage_slot(stage):
+    """
+    Waits for a free slot for `stage` (e.g. 'render') and holds it for the block.
+    """
+    semaphore = _semaphores().get(stage)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+class LeaseLost(Exception):
+    """
+    Raised in a worker whose lease on its task expired and may have been
+    handed to another worker.
+    """
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _lease_expiry(now):
+    return now + timedelta(seconds=getattr(settings, 'TASK_LEASE_SECONDS', 120))
+
+
+def claim_task(task_id, worker_id):
+    """
+    Atomically moves a pending task to PROCESSING for `worker_id`.
+    Returns False if another worker got to it first.
+    """
+    now = timezone.now()
+    claimed = ConversionTask.objects.filter(id=task_id, status='PENDING').update(
+        status='PROCESSING',
+        claimed_by=worker_id,
+        heartbeat_at=now,
+        lease_expires_at=_lease_expiry(now),
+        attempts=F('attempts') + 1,
+        version=F('version') + 1,
+    )
+    return claimed == 1
+
+
+def claim_next(worker_id):
+    """
+    Claims the oldest pending task, returning its id, or None if the queue is empty.
+    """
+    pending = (ConversionTask.objects.filter(status='PENDING')
+               .order_by('created_at').values_list('id', flat=True)[:20])
+    for task_id in pending:
+        if claim_task(task_id, worker_id):
+            return task_id
+    return None
+
+
+def heartbeat(task_id, worker_id):
+    """
+    Extends the lease on a claimed task. Returns False if the lease was lost.
+    """
+    now = timezone.now()
+    return ConversionTask.objects.filter(
+        id=task_id, status='PROCESSING', claimed_by=worker_id,
+    ).update(heartbeat_at=now, lease_expires_at=_lease_expiry(now)) == 1
+
+
+def log_line(task_id, message):
+    """
+    Appends a line to a task's log without touching its progress.
+    """
+    # A new version, so status polls revalidating by ETag see the line
+    ConversionTask.objects.filter(id=task_id).update(version=F('version') + 1)
+    entry = TaskLogEntry.objects.create(task_id=task_id, message=message)
+    events.publish(task_id, {'log': entry.line(), 'log_id': entry.id})
+
+
+def is_stale(task):
+    """
+    True if a queued or running task has been abandoned: its worker's lease
+    expired, or it has waited unclaimed for longer than a lease, e.g. because
+    the web process that queued it was restarted.
+    """
+    now = timezone.now()
+    if task.status == 'PROCESSING':
+        return task.lease_expires_at is not None and task.lease_expires_at < now
+    if task.status == 'PENDING':
+        waiting_since = task.heartbeat_at or task.created_at
+        return task.claimed_by is None and waiting_since < now - timedelta(
+            seconds=getattr(settings, 'TASK_LEASE_SECONDS', 120))
+    return False
+
+
+def requeue_stale(task, force=False):
+    """
+    Takes back an abandoned task (see is_stale): puts it back in the queue,
+    or fails it if `force` asks for a fresh run or it has used up
+    TASK_MAX_ATTEMPTS. Returns the task's new status, or None if a worker
+    claimed or heartbeated it in the meantime.
+    """
+    if force or task.attempts >= getattr(settings, 'TASK_MAX_ATTEMPTS', 3):
+        fields = {'status': 'FAILED', 'error_message': "Abandoned by its worker and replaced by a new run"
+                  if force else "Worker stopped responding"}
+    else:
+        fields = {'status': 'PENDING', 'current_step': "Queued (retrying after worker was lost)"}
+    taken = ConversionTask.objects.filter(
+        id=task.id, status=task.status, claimed_by=task.claimed_by, lease_expires_at=task.lease_expires_at,
+    ).update(claimed_by=None, lease_expires_at=None, version=F('version') + 1, **fields)
+    return fields['status'] if taken else None
+
+
+def release(task_id, worker_id):
+    ConversionTask.objects.filter(id=task_id, claimed_by=worker_id).update(
+        claimed_by=None, lease_expires_at=None,
+    )
+
+
+def requeue_expired():
+    """
+    Puts tasks whose worker stopped heartbeating back in the queue, or fails
+    them once they have used up TASK_MAX_ATTEMPTS. Returns (requeued, failed).
+    """
+    expired = ConversionTask.objects.filter(status='PROCESSING', lease_expires_at__lt=timezone.now())
+    max_attempts = getattr(settings, 'TASK_MAX_ATTEMPTS', 3)
+    requeued = expired.filter(attempts__lt=max_attempts).update(
+        status='PENDING', claimed_by=None, lease_expires_at=None,
+        current_step="Queued (retrying after worker was lost)",
+        version=F('version') + 1,
+    )
+    failed = expired.filter(attempts__gte=max_attempts).update(
+        status='FAILED', claimed_by=None, lease_expires_at=None,
+        error_message=f"Worker stopped responding after {max_attempts} attempts",
+        version=F('version') + 1,
+    )
+    return requeued, failed
+
+
+class Heartbeat(threading.Thread):
+    """
+    Background thread that keeps a task's lease alive while it is processed.
+    `lost` is set once the lease could not be renewed.
+    """
+
+    def __init__(self, task_id, worker_id):
+        super().__init__(daemon=True)
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.interval = getattr(settings, 'TASK_LEASE_SECONDS', 120) / 4
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                if not heartbeat(self.task_id, self.worker_id):
+                    self.lost.set()
+                    log_line(self.task_id, f"Worker {self.worker_id} lost its lease, stopping")
+                    break
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def run_claimed(task_id, worker_id):
+    """
+    Runs the pipeline for a task this worker has claimed, heartbeating meanwhile.
+    The run stops at the next stage if the lease is lost.
+    """
+    from .agents import Orchestrator
+
+    beat = Heartbeat(task_id, worker_id)
+    beat.start()
+    try:
+        Orchestrator(task_id, worker_id=worker_id, lease_lost=beat.lost)._process()
+    finally:
+        beat.stop()
+        release(task_id, worker_id)
+
+
+def _run_in_thread(task_id):
+    worker_id = worker_name()
+    try:
+        if claim_task(task_id, worker_id):
+            run_claimed(task_id, worker_id)
+    finally:
+        with _executor_lock:
+            _submitted.discard(task_id)
+        connection.close()
+
+
+def recover():
+    """
+    Re-queues tasks whose lease expired (see requeue_expired) and submits
+    every pending task to the thread pool, so tasks that were queued or
+    running when a web process stopped are run again. Returns (requeued, failed).
+    """
+    requeued, failed = requeue_expired()
+    pending = ConversionTask.objects.filter(status='PENDING').order_by('created_at').values_list('id', flat=True)
+    for task_id in pending:
+        submit(task_id)
+    return requeued, failed
+
+
+def _recover_periodically():
+    # The thread pool's counterpart of the requeue loop in `manage.py worker`
+    interval = getattr(settings, 'TASK_LEASE_SECONDS', 120) / 2
+    while True:
+        try:
+            requeued, failed = recover()
+            if requeued or failed:
+                print(f"Re-queued {requeued} and failed {failed} tasks with expired leases")
+        except Exception as e:
+            print(f"Error recovering tasks: {e}")
+        finally:
+            connection.close()
+        time.sleep(interval)
+
+
+def enqueue(task_id):
+    """
+    Hands a pending task to the configured TASK_RUNNER.
+    """
+    # In queue mode the task stays PENDING until a `manage.py worker` claims it
+    if getattr(settings, 'TASK_RUNNER', 'thread') == 'queue':
+        return
+    submit(task_id)
+
+
+def submit(task_id):
+    """
+    Runs a task on the web process's bounded thread pool (TASK_RUNNER = 'thread').
+    Starting the pool also starts recovering abandoned tasks (see `recover`).
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'TASK_THREADS', 2),
+                                           thread_name_prefix='conversion')
+            threading.Thread(target=_recover_periodically, name='conversion-recovery', daemon=True).start()
+        if task_id in _submitted:
+            return
+        _submitted.add(task_id)
+    _executor.submit(_run_in_thread, task_id)
@@ -0,0 +1,70 @@
+import functools
+import os
+import re
+
+from django.conf import settings
+
+# Prompts asking for an opening and closing contain this, so the stub can answer in kind
+FRAME_SEPARATOR_HINT = "a line containing only ---"
+
+
+@functools.lru_cache(maxsize=None)
+def get_model(model_name, api_key):
+    """
+    The Gemini client for `model_name`, configured once per process.
+    """
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+class GeminiBackend:
+    """
+    Generates text with Google Gemini.
+    """
+
+    name = 'gemini'
+
+    def __init__(self, model=None):
+        self.model = model or getattr(settings, 'GEMINI_MODEL', 'gemini-2.0-flash')
+
+    def generate(self, prompt):
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        return get_model(self.model, api_key).generate_content(prompt).text
+
+
+class StubBackend:
+    """
+    Offline backend for tests and benchmarks. It turns the material at the
+    end of a prompt (after its last "Content:" label) into dialogue, one
+    sentence per line with alternating hosts, so its output is
+    deterministic and covers all of its input.
+    """
+
+    name = 'stub'
+    model = 'stub'
+
+    def generate(self, prompt):
+        material = prompt.rsplit('Content:', 1)[-1].split('Podcast Script:')[0].strip()
+        if FRAME_SEPARATOR_HINT in prompt:
+            topic = material.splitlines()[0] if material else "today's post"
+            return f"Host A: Welcome to the show! Today we are talking about {topic}\n---\n" \
+                   f"Host B: That's all for today, thanks for listening!"
+        sentences = [s for s in re.split(r'(?<=[.!?])\s+', ' '.join(material.split())) if s]
+        return '\n'.join(f"Host {'AB'[i % 2]}: {sentence}" for i, sentence in enumerate(sentences))
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def get_backend(name, **options):
+    try:
+        return BACKENDS[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown LLM backend: {name}")
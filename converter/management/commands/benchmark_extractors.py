@@ -0,0 +1,71 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from converter.extract import EXTRACTORS
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'fixtures', 'pages')
+
+
+def word_overlap(extracted, reference):
+    """
+    Precision and recall of the extracted words against the reference text.
+    """
+    extracted_words = Counter(extracted.lower().split())
+    reference_words = Counter(reference.lower().split())
+    common = sum((extracted_words & reference_words).values())
+    precision = common / max(1, sum(extracted_words.values()))
+    recall = common / max(1, sum(reference_words.values()))
+    return precision, recall
+
+
+class Command(BaseCommand):
+    help = ("Compares the content extractors on saved HTML pages. A page.txt next to "
+            "page.html holds the article text used to score the extracted text.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', nargs='?', default=PAGES_DIR, help="Directory of saved .html pages")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per page and extractor")
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        pages = sorted(name for name in os.listdir(directory) if name.endswith('.html'))
+        if not pages:
+            raise CommandError(f"No .html pages in {directory}")
+
+        totals = {name: {'seconds': 0.0, 'precision': [], 'recall': []} for name in EXTRACTORS}
+        self.stdout.write(f"{'page':<24} {'extractor':<10} {'ms':>8} {'chars':>7} {'precision':>10} {'recall':>7}")
+        for page in pages:
+            with open(os.path.join(directory, page), 'rb') as f:
+                html = f.read()
+            reference = None
+            reference_path = os.path.join(directory, page[:-len('.html')] + '.txt')
+            if os.path.exists(reference_path):
+                with open(reference_path, encoding='utf-8') as f:
+                    reference = f.read()
+
+            for name, extractor in EXTRACTORS.items():
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    text = extractor(html)
+                seconds = (time.perf_counter() - start) / options['repeat']
+                totals[name]['seconds'] += seconds
+
+                precision = recall = ''
+                if reference is not None:
+                    p, r = word_overlap(text, reference)
+                    totals[name]['precision'].append(p)
+                    totals[name]['recall'].append(r)
+                    precision, recall = f"{p:.2f}", f"{r:.2f}"
+                self.stdout.write(f"{page:<24} {name:<10} {seconds * 1000:>8.2f} {len(text):>7} "
+                                  f"{precision:>10} {recall:>7}")
+
+        self.stdout.write("")
+        for name, total in totals.items():
+            line = f"{name}: {total['seconds'] * 1000:.2f} ms for {len(pages)} pages"
+            if total['precision']:
+                line += (f", mean precision {sum(total['precision']) / len(total['precision']):.2f}"
+                         f", mean recall {sum(total['recall']) / len(total['recall']):.2f}")
+            self.stdout.write(line)
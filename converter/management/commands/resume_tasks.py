@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from converter import checkpoints, jobs
+from converter.models import ConversionTask
+
+
+class Command(BaseCommand):
+    help = "Retries tasks from their first missing or invalid stage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('task_ids', nargs='*', help="Tasks to retry")
+        parser.add_argument('--failed', action='store_true', help="Retry every failed task")
+        parser.add_argument('--from-stage', choices=checkpoints.STAGES,
+                            help="Restart from this stage even if its checkpoint is valid")
+
+    def handle(self, *args, **options):
+        task_ids = list(options['task_ids'])
+        if options['failed']:
+            task_ids += ConversionTask.objects.filter(status='FAILED').values_list('id', flat=True)
+        if not task_ids:
+            raise CommandError("Give task ids or --failed")
+
+        queued = getattr(settings, 'TASK_RUNNER', 'thread') == 'queue'
+        for task_id in task_ids:
+            try:
+                task = checkpoints.prepare_retry(task_id, from_stage=options['from_stage'])
+            except (ConversionTask.DoesNotExist, ValueError) as e:
+                self.stderr.write(f"{task_id}: {e}")
+                continue
+
+            stage = options['from_stage'] or checkpoints.first_invalid_stage(task) or 'nothing left to run'
+            if queued:
+                self.stdout.write(f"{task_id}: queued, resuming from {stage}")
+                continue
+
+            self.stdout.write(f"{task_id}: resuming from {stage}")
+            worker_id = jobs.worker_name()
+            if jobs.claim_task(task.id, worker_id):
+                jobs.run_claimed(task.id, worker_id)
+            task.refresh_from_db()
+            self.stdout.write(f"{task_id}: {task.status}")
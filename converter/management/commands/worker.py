@@ -0,0 +1,78 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+def worker_process(semaphores, stop_event, poll_interval):
+    """
+    Entry point of each worker process: claim a task, run it, repeat.
+    """
+    import django
+    django.setup()
+
+    from converter import jobs
+
+    # Ctrl-C goes to the whole process group; let the parent stop us between tasks
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    jobs.install_stage_semaphores(semaphores)
+    worker_id = jobs.worker_name()
+
+    while not stop_event.is_set():
+        task_id = jobs.claim_next(worker_id)
+        if task_id is None:
+            stop_event.wait(poll_interval)
+            continue
+        print(f"[{worker_id}] Processing task {task_id}")
+        jobs.run_claimed(task_id, worker_id)
+
+
+class Command(BaseCommand):
+    help = "Runs queued conversion tasks in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'WORKER_PROCESSES', 4),
+                            help="Number of worker processes")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds between queue checks when idle")
+
+    def handle(self, *args, **options):
+        from converter import jobs
+
+        context = multiprocessing.get_context('spawn')
+        # Stage limits are shared by every process in the pool
+        semaphores = {
+            stage: context.BoundedSemaphore(limit)
+            for stage, limit in getattr(settings, 'STAGE_CONCURRENCY', {}).items()
+        }
+        stop_event = context.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+        processes = [None] * options['processes']
+        self.stdout.write(f"Starting {len(processes)} worker processes")
+        try:
+            while not stop_event.is_set():
+                for slot, process in enumerate(processes):
+                    if process is None or not process.is_alive():
+                        if process is not None:
+                            self.stderr.write(f"Worker {slot} exited with code {process.exitcode}, restarting")
+                        process = context.Process(
+                            target=worker_process,
+                            args=(semaphores, stop_event, options['poll_interval']),
+                        )
+                        process.start()
+                        processes[slot] = process
+
+                requeued, failed = jobs.requeue_expired()
+                if requeued or failed:
+                    self.stdout.write(f"Re-queued {requeued} and failed {failed} tasks with expired leases")
+
+                stop_event.wait(options['poll_interval'])
+        except KeyboardInterrupt:
+            stop_event.set()
+        finally:
+            self.stdout.write("Waiting for running tasks to finish...")
+            for process in processes:
+                if process is not None:
+                    process.join()
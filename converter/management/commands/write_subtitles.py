@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from converter.agents import VideoGenerationAgent
+from converter.models import ConversionTask
+
+
+class Command(BaseCommand):
+    help = ("Rewrites the .vtt/.srt captions of finished tasks from their timing map and "
+            "replaces the video's text track, without rendering the video again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('task_ids', nargs='+', help="Tasks to update")
+
+    def handle(self, *args, **options):
+        for task_id in options['task_ids']:
+            try:
+                agent = VideoGenerationAgent(task_id)
+            except (ConversionTask.DoesNotExist, ValueError) as e:
+                self.stderr.write(f"{task_id}: {e}")
+                continue
+            if not agent.task.video_file or not agent.task.timing_map:
+                self.stderr.write(f"{task_id}: no video or timing map to caption")
+                continue
+
+            subtitle_file = agent.update_subtitles()
+            self.stdout.write(f"{task_id}: wrote {subtitle_file}")
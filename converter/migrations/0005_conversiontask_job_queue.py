@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0004_conversiontask_timing_map'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversiontask',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversiontask',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversiontask',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversiontask',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='conversiontask',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], db_index=True, default='PENDING', max_length=20),
+        ),
+    ]
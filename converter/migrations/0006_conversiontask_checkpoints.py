@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0005_conversiontask_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversiontask',
+            name='checkpoints',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='conversiontask',
+            name='content',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0006_conversiontask_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('message', models.TextField()),
+                ('task', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='log_entries', to='converter.conversiontask')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task', 'id'], name='converter_t_task_id_897420_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0007_tasklogentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversiontask',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:25
+
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.db import migrations, models
+
+# Frozen copies of converter.dedup as of this migration, so later changes there leave it alone
+TRACKING_PARAMS = {'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ref', 'ref_src'}
+
+
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key not in TRACKING_PARAMS and not key.startswith('utm_'))
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def backfill(apps, schema_editor):
+    ConversionTask = apps.get_model('converter', 'ConversionTask')
+    for task in ConversionTask.objects.all():
+        task.normalized_url = normalize_url(task.url)
+        task.content_hash = content_hash(task.content) if task.content else None
+        task.save(update_fields=['normalized_url', 'content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0008_conversiontask_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversiontask',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversiontask',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversiontask',
+            name='normalized_url',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='conversiontask',
+            name='regenerate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0009_conversiontask_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversiontask',
+            name='subtitle_file',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0010_conversiontask_subtitle_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversiontask',
+            name='render_profile',
+            field=models.CharField(default='full', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0011_conversiontask_render_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversiontask',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
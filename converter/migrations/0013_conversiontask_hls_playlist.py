@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0012_conversiontask_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversiontask',
+            name='hls_playlist',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+def fail_duplicates(apps, schema_editor):
+    # Only the newest running task per URL and profile can satisfy the constraint
+    ConversionTask = apps.get_model('converter', 'ConversionTask')
+    active = (ConversionTask.objects.filter(status__in=['PENDING', 'PROCESSING'])
+              .exclude(normalized_url='').order_by('-created_at'))
+    seen = set()
+    for task in active:
+        key = (task.normalized_url, task.render_profile)
+        if key in seen:
+            task.status = 'FAILED'
+            task.error_message = "Superseded by a newer task for the same post"
+            task.save(update_fields=['status', 'error_message'])
+        seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0013_conversiontask_hls_playlist'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversiontask',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('PENDING', 'PROCESSING')), models.Q(('normalized_url', ''), _negated=True)), fields=('normalized_url', 'render_profile'), name='one_active_task_per_url'),
+        ),
+    ]
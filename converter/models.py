@@ -1,6 +1,10 @@
 from django.db import models
+from django.utils import timezone
 import uuid
 
+# Statuses of a task that is queued or being processed
+ACTIVE_STATUSES = ('PENDING', 'PROCESSING')
+
 class ConversionTask(models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -11,16 +15,94 @@ class ConversionTask(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     url = models.URLField()
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # Requests are coalesced on the normalized URL and the extracted content's hash
+    normalized_url = models.CharField(max_length=500, blank=True, default="", db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    # Set when the client asked to regenerate instead of reusing earlier results
+    regenerate = models.BooleanField(default=False)
+    # Key of settings.RENDER_PROFILES the video is rendered with
+    render_profile = models.CharField(max_length=20, default='full')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING', db_index=True)
     progress = models.IntegerField(default=0)
     current_step = models.CharField(max_length=100, default="Queued")
+    content = models.TextField(blank=True, null=True)
     script = models.TextField(blank=True, null=True)
     audio_file = models.CharField(max_length=255, blank=True, null=True)
     video_file = models.CharField(max_length=255, blank=True, null=True)
+    # WebVTT captions shown by the player when they are not burned into the video; an .srt sits next to it
+    subtitle_file = models.CharField(max_length=255, blank=True, null=True)
+    # Smaller copies of the video encoded in the same pass, by render profile name
+    renditions = models.JSONField(default=dict, blank=True)
+    # HLS playlist of the video, set as soon as its first segment has been written
+    hls_playlist = models.CharField(max_length=255, blank=True, null=True)
     error_message = models.TextField(blank=True, null=True)
+    # Log lines from before TaskLogEntry; new lines are only written there
     logs = models.TextField(blank=True, default="")
     timing_map = models.JSONField(default=list, blank=True)
+    # Per-stage output hashes, used to resume a retried task where it failed
+    checkpoints = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    # Job queue bookkeeping: which worker holds the task and until when
+    claimed_by = models.CharField(max_length=100, blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    attempts = models.IntegerField(default=0)
+
+    # Bumped on every change, so status responses can be cached by ETag
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Identical requests join one running task, even across web processes (see dedup.find_or_create)
+            models.UniqueConstraint(
+                fields=['normalized_url', 'render_profile'],
+                condition=models.Q(status__in=ACTIVE_STATUSES) & ~models.Q(normalized_url=''),
+                name='one_active_task_per_url',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.url} - {self.status}"
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        # Increment in the database so concurrent saves cannot reuse a version
+        version = self.version
+        self.version = models.F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            # Nothing was written; a failed transaction also allows no query to reload it
+            self.version = version
+            raise
+        self.refresh_from_db(fields=['version'])
+
+    def log_text(self):
+        """
+        The task's log, one "[HH:MM:SS] message" line per entry.
+        """
+        lines = [entry.line() for entry in self.log_entries.order_by('id')]
+        return self.logs + ''.join(lines)
+
+
+class TaskLogEntry(models.Model):
+    """
+    One line of a task's log. Lines are only ever appended, so logging a step
+    is a small insert instead of rewriting an ever-growing text column.
+    """
+    # Indexed together with id below, which also serves lookups by task alone
+    task = models.ForeignKey(ConversionTask, on_delete=models.CASCADE, related_name='log_entries',
+                             db_index=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    message = models.TextField()
+
+    class Meta:
+        indexes = [models.Index(fields=['task', 'id'])]
+
+    def line(self):
+        return f"[{timezone.localtime(self.created_at).strftime('%H:%M:%S')}] {self.message}\n"
@@ -0,0 +1,271 @@
+import os
+import struct
+from collections import namedtuple
+
+# Bitrates in kbps by (MPEG version, layer); MPEG-2.5 shares the MPEG-2 tables
+BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    25: [11025, 12000, 8000],  # MPEG-2.5
+}
+VERSIONS = {0: 25, 2: 2, 3: 1}
+LAYERS = {1: 3, 2: 2, 3: 1}
+
+FrameHeader = namedtuple('FrameHeader', [
+    'version', 'layer', 'bitrate', 'sample_rate', 'mono', 'samples', 'length',
+])
+
+
+class Mp3Info(namedtuple('Mp3Info', [
+        'sample_rate', 'samples_per_frame', 'frames', 'encoder_delay', 'encoder_padding',
+        'audio_start', 'audio_end', 'first_header', 'bitrate'])):
+    """
+    Layout of an MP3 stream: its audio frames span data[audio_start:audio_end],
+    after any ID3v2 tag and Xing/Info/VBRI header frame. `bitrate` is that of
+    the audio frames, or None if it varies between them.
+    """
+
+    @property
+    def cbr(self):
+        return self.bitrate is not None or not self.frames
+
+    @property
+    def duration(self):
+        """
+        Seconds of audio in the frames, as played when they are concatenated.
+        """
+        return self.frames * self.samples_per_frame / self.sample_rate
+
+    @property
+    def gapless_duration(self):
+        """
+        Seconds of audio without the encoder delay and padding from a LAME tag
+        (or the delay from a VBRI header).
+        """
+        samples = self.frames * self.samples_per_frame - self.encoder_delay - self.encoder_padding
+        return max(0, samples) / self.sample_rate
+
+
+def parse_header(data, pos):
+    """
+    Decodes the 4-byte frame header at `pos`, or returns None if there is none.
+    """
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+
+    version = VERSIONS.get((b1 >> 3) & 3)
+    layer = LAYERS.get((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    # Free-format bitrates (index 0) do not give a frame length, so are not supported
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    bitrate = BITRATES[(min(version, 2), layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == 1 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+
+    return FrameHeader(version, layer, bitrate, sample_rate, b3 >> 6 == 3, samples, length)
+
+
+def id3v2_size(data):
+    """
+    Length of the ID3v2 tag at the start of `data`, or 0 if there is none.
+    """
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _info_frame(data, pos, header):
+    """
+    Reads a Xing/Info or VBRI header frame. Returns (encoder_delay, encoder_padding)
+    if the frame at `pos` is one, otherwise None. VBRI headers only record
+    the delay, so their padding is 0.
+    """
+    end = pos + header.length
+    if header.version == 1:
+        side_info = 17 if header.mono else 32
+    else:
+        side_info = 9 if header.mono else 17
+
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        (flags,) = struct.unpack('>I', data[xing + 4:xing + 8])
+        lame = xing + 8
+        lame += 4 if flags & 1 else 0     # frame count
+        lame += 4 if flags & 2 else 0     # byte count
+        lame += 100 if flags & 4 else 0   # seek table
+        lame += 4 if flags & 8 else 0     # quality
+        # The LAME extension (also written by ffmpeg) stores 12-bit delay and padding
+        if lame + 24 <= end and data[lame:lame + 4].isalpha():
+            delay_padding = int.from_bytes(data[lame + 21:lame + 24], 'big')
+            return delay_padding >> 12, delay_padding & 0xFFF
+        return 0, 0
+
+    # Fraunhofer's VBRI header always sits 32 bytes after the frame header:
+    # tag, version, then the encoder delay in samples
+    vbri = pos + 36
+    if data[vbri:vbri + 4] == b'VBRI' and vbri + 8 <= end:
+        (delay,) = struct.unpack('>H', data[vbri + 6:vbri + 8])
+        return delay, 0
+
+    return None
+
+
+def probe(data):
+    """
+    Parses an in-memory MP3 file frame by frame.
+
+    Counting frames gives the exact sample count for CBR and VBR streams
+    alike; a LAME tag in the first frame adds the encoder delay and padding,
+    and a VBRI header the delay alone.
+    Raises ValueError if no MPEG audio frames are found.
+    """
+    pos = id3v2_size(data)
+    first = None
+    frames = 0
+    delay = padding = 0
+    audio_start = audio_end = None
+    bitrates = set()
+
+    while pos + 4 <= len(data):
+        header = parse_header(data, pos)
+        # Frames after the first must share its format, which rules out false syncs
+        if header is not None and first is not None and (
+                header.version, header.layer, header.sample_rate) != (
+                first.version, first.layer, first.sample_rate):
+            header = None
+        if header is None or pos + header.length > len(data):
+            if header is not None:
+                break  # truncated final frame
+            pos = data.find(b'\xff', pos + 1)
+            if pos < 0:
+                break
+            continue
+
+        if first is None:
+            first = header
+            info = _info_frame(data, pos, header)
+            if info is not None:
+                delay, padding = info
+                pos += header.length
+                continue
+
+        if audio_start is None:
+            audio_start = pos
+        bitrates.add(header.bitrate)
+        frames += 1
+        pos += header.length
+        audio_end = pos
+
+    if first is None:
+        raise ValueError("No MPEG audio frames found")
+
+    return Mp3Info(
+        sample_rate=first.sample_rate,
+        samples_per_frame=first.samples,
+        frames=frames,
+        encoder_delay=delay,
+        encoder_padding=padding,
+        audio_start=audio_start or 0,
+        audio_end=audio_end or 0,
+        first_header=first,
+        bitrate=bitrates.pop() if len(bitrates) == 1 else None,
+    )
+
+
+def probe_file(path):
+    with open(path, 'rb') as f:
+        return probe(f.read())
+
+
+def info_frame(header_bytes, header, frames, size, cbr=True):
+    """
+    Builds a Xing/Info header frame in the format of `header`, recording the
+    stream's frame and byte counts so players report the right duration.
+    """
+    if header.version == 1:
+        side_info = 17 if header.mono else 32
+    else:
+        side_info = 9 if header.mono else 17
+    # Clear the padding bit so the frame length is the unpadded one
+    frame_header = bytes([header_bytes[0], header_bytes[1], header_bytes[2] & ~0x02, header_bytes[3]])
+    length = parse_header(frame_header, 0).length
+
+    tag = b'Info' if cbr else b'Xing'
+    body = bytes(side_info) + tag + struct.pack('>III', 0x03, frames, size)
+    if 4 + len(body) > length:
+        raise ValueError("Frame too small for a Xing header")
+    return (frame_header + body).ljust(length, b'\x00')
+
+
+def concatenate(output_path, segments):
+    """
+    Joins MP3 segments (bytes) into one file in a single streaming pass.
+
+    Each segment's ID3 tags and header frame are dropped and only its audio
+    frames are written; a single Info/Xing frame describing the whole stream
+    is written at the start once the totals are known. Returns the Mp3Info
+    of every segment that was written, in order.
+    """
+    written = []
+    frames = 0
+    bitrates = set()
+    first = None
+
+    temp_path = f"{output_path}.part"
+    try:
+        with open(temp_path, 'wb') as out:
+            placeholder = 0
+            for data in segments:
+                info = probe(data)
+                if not info.frames:
+                    continue
+
+                if first is None:
+                    first = info
+                    header_bytes = data[info.audio_start:info.audio_start + 4]
+                    # Reserve room for the header frame; it is filled in at the end
+                    placeholder = len(info_frame(header_bytes, info.first_header, 0, 0))
+                    out.write(bytes(placeholder))
+
+                out.write(memoryview(data)[info.audio_start:info.audio_end])
+                frames += info.frames
+                # Of the audio frames: the header frame may be written at another bitrate
+                bitrates.add(info.bitrate)
+                written.append(info)
+
+            if first is None:
+                raise ValueError("No MPEG audio frames to concatenate")
+
+            size = out.tell()
+            out.seek(0)
+            out.write(info_frame(header_bytes, first.first_header, frames, size,
+                                 cbr=len(bitrates) == 1 and None not in bitrates))
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return written
@@ -0,0 +1,459 @@
+import bisect
+import functools
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FRAME_WIDTH = 1920
+FRAME_HEIGHT = 1080
+
+# Background animation and layout constants are in 1920x1080 frame
+# coordinates; other sizes scale them by height / FRAME_HEIGHT
+GRADIENT_PERIOD = 10  # seconds for the gradient to scroll a full screen
+CIRCLE_CENTERS = [(480, 270), (1440, 270), (960, 810)]
+CIRCLE_COLOR = (60, 100, 200)
+NUM_PARTICLES = 30
+PARTICLE_COLOR = (200, 200, 255)
+# Bump when the gradient changes, so plates cached on disk are rebuilt
+BACKGROUND_VERSION = 1
+
+TITLE_TEXT = "Graffiti - AI Podcast"
+SPEAKER_STYLES = {
+    'Host A': ((96, 165, 250), "🎙️"),   # Light blue
+    'Host B': ((192, 132, 252), "🎤"),  # Light purple
+}
+
+
+# Background assets depend only on the frame size, so they are shared by every job in the process
+_plates = {}
+_ring_masks = {}
+_assets_lock = threading.Lock()
+
+
+def _build_plate(width, height):
+    progress = np.arange(height) / height
+    rows = np.stack([
+        15 + progress * 100,
+        23 + progress * 50,
+        42 + progress * 180,
+    ], axis=1).astype(np.uint8)
+    return np.ascontiguousarray(np.broadcast_to(rows[:, None, :], (height, width, 3)))
+
+
+def _load_plate(width, height, cache_dir):
+    """
+    Maps the plate from `cache_dir`, writing it there first if needed. Every
+    worker process maps the same file, so they share one copy in the page
+    cache instead of each building its own.
+    """
+    path = os.path.join(cache_dir, f"gradient_{width}x{height}_v{BACKGROUND_VERSION}.npy")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, _build_plate(width, height))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return np.load(path, mmap_mode='r')
+
+
+def gradient_plate(width, height, cache_dir=None):
+    """
+    The background gradient at t=0 as a full frame. The gradient only ever
+    scrolls, so the frame at any later time is this plate with its rows
+    rotated, and one plate covers the whole period.
+    """
+    key = (width, height, cache_dir)
+    with _assets_lock:
+        plate = _plates.get(key)
+        if plate is None:
+            if cache_dir:
+                try:
+                    plate = _load_plate(width, height, cache_dir)
+                except OSError as e:
+                    print(f"Background cache unavailable ({e}), keeping the plate in memory")
+            if plate is None:
+                plate = _build_plate(width, height)
+            _plates[key] = plate
+        return plate
+
+
+def ring_mask(width, height, circle_radius):
+    """
+    Flat pixel indices and colour increments for the three rings drawn at
+    the given pulse radius.
+    """
+    key = (width, height, circle_radius)
+    mask = _ring_masks.get(key)
+    if mask is not None:
+        return mask
+
+    scale = height / FRAME_HEIGHT
+    indices = []
+    deltas = []
+    for cx, cy in CIRCLE_CENTERS:
+        for radius in range(circle_radius, circle_radius + 50, 10):
+            alpha = 1 - (radius - circle_radius) / 50
+            delta = [int(c * alpha) for c in CIRCLE_COLOR]
+            for angle in range(0, 360, 5):
+                x = int(cx * scale + radius * scale * math.cos(math.radians(angle)))
+                y = int(cy * scale + radius * scale * math.sin(math.radians(angle)))
+                if 0 <= x < width and 0 <= y < height:
+                    indices.append(y * width + x)
+                    deltas.append(delta)
+
+    # Points landing on the same pixel add up, as they did when drawn one by one
+    unique, inverse = np.unique(np.array(indices, dtype=np.int64), return_inverse=True)
+    summed = np.zeros((len(unique), 3), dtype=np.int16)
+    np.add.at(summed, inverse, np.array(deltas, dtype=np.int16))
+
+    mask = (unique, summed)
+    _ring_masks[key] = mask
+    return mask
+
+
+class BackgroundRenderer:
+    """
+    Renders the animated podcast background (scrolling gradient, pulsing
+    circles and floating particles) using whole-array NumPy operations.
+
+    The gradient is copied from a shared plate (see `gradient_plate`, kept
+    in `cache_dir` if given) and the ring masks are shared between
+    renderers, so each call to `render` is two block copies and a few
+    fancy-index writes.
+    """
+
+    def __init__(self, width=FRAME_WIDTH, height=FRAME_HEIGHT, cache_dir=None):
+        self.width = width
+        self.height = height
+        self.scale = height / FRAME_HEIGHT
+        self._plate = gradient_plate(width, height, cache_dir)
+
+        # Pixel offsets of the round particle sprite
+        r = max(1, round(3 * self.scale))
+        offsets = [(dy, dx) for dy in range(-r, r + 1) for dx in range(-r, r + 1) if dx * dx + dy * dy <= r * r]
+        self._sprite_dy = np.array([o[0] for o in offsets])
+        self._sprite_dx = np.array([o[1] for o in offsets])
+        self._particle_ids = np.arange(NUM_PARTICLES)
+
+    def render(self, t):
+        """
+        Returns the background frame for time `t` as an (h, w, 3) uint8 array.
+        """
+        h = self.height
+        shift = math.floor(t / GRADIENT_PERIOD * h) % h
+        frame = np.empty((h, self.width, 3), dtype=np.uint8)
+        frame[:h - shift] = self._plate[shift:]
+        frame[h - shift:] = self._plate[:shift]
+        self._draw_circles(frame, t)
+        self._draw_particles(frame, t)
+        return frame
+
+    def _draw_circles(self, frame, t):
+        pulse = abs(math.sin(t * 2))
+        indices, deltas = ring_mask(self.width, self.height, int(200 + pulse * 100))
+        pixels = frame.reshape(-1, 3)
+        values = pixels[indices].astype(np.int16) + deltas
+        pixels[indices] = np.minimum(values, 255)
+
+    def _draw_particles(self, frame, t):
+        w, h = self.width, self.height
+        ids = self._particle_ids
+        particle_t = (t + ids * 2) % 20
+        px = ((w / NUM_PARTICLES * ids + particle_t * 50 * self.scale) % w).astype(np.int64)
+        py = (h / 2 + np.sin(t + ids) * 300 * self.scale).astype(np.int64)
+        visible = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+
+        ys = py[visible, None] + self._sprite_dy[None, :]
+        xs = px[visible, None] + self._sprite_dx[None, :]
+        inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        frame[ys[inside], xs[inside]] = PARTICLE_COLOR
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(name, size):
+    """
+    Loads a TrueType font once per process, falling back to PIL's default.
+    """
+    try:
+        return ImageFont.truetype(name, size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def wrap_caption(text):
+    """
+    Formats a subtitle as a bullet, wrapped at 70 characters to at most two lines.
+    """
+    bullet_text = f"• {text}"
+    if len(bullet_text) <= 70:
+        return [bullet_text]
+
+    words = bullet_text.split()
+    lines = []
+    current_line = "• "
+    for word in words[1:]:
+        if len(current_line + word) > 70:
+            lines.append(current_line.strip())
+            current_line = "  " + word + " "
+        else:
+            current_line += word + " "
+    if current_line.strip():
+        lines.append(current_line.strip())
+    return lines[:2]
+
+
+Caption = namedtuple('Caption', ['index', 'start', 'end', 'speaker', 'lines'])
+
+
+class SubtitleIndex:
+    """
+    A timing map compiled into sorted, pre-wrapped caption intervals.
+
+    Frame times mostly move forward, so lookups first check the caption
+    under a cursor and only bisect when playback moves to another one.
+    """
+
+    def __init__(self, segments, offset=0):
+        ordered = sorted(enumerate(segments), key=lambda item: item[1]['start'])
+        self.captions = [
+            Caption(
+                index=index,
+                start=segment['start'] + offset,
+                end=segment['end'] + offset,
+                speaker=segment['speaker'],
+                lines=wrap_caption(segment['text']),
+            )
+            for index, segment in ordered
+        ]
+        self._starts = [caption.start for caption in self.captions]
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self.captions)
+
+    def at(self, t):
+        """
+        Returns the caption shown at time `t`, or None.
+        """
+        if not self.captions:
+            return None
+
+        i = self._cursor
+        next_start = self._starts[i + 1] if i + 1 < len(self._starts) else float('inf')
+        if not self._starts[i] <= t < next_start:
+            i = max(bisect.bisect_right(self._starts, t) - 1, 0)
+            self._cursor = i
+
+        caption = self.captions[i]
+        if caption.start <= t < caption.end:
+            return caption
+        return None
+
+
+class Layer:
+    """
+    An RGBA image cropped to its visible area, with the blend terms
+    precomputed so compositing onto a frame is pure integer arithmetic.
+    """
+
+    def __init__(self, image):
+        bbox = image.getbbox()
+        if bbox is None:
+            bbox = (0, 0, 0, 0)
+        self.x0, self.y0, self.x1, self.y1 = bbox
+
+        rgba = np.asarray(image.crop(bbox), dtype=np.uint16)
+        alpha = rgba[:, :, 3:]
+        self.opaque = bool((alpha == 255).all())
+        if self.opaque:
+            self.rgb = rgba[:, :, :3].astype(np.uint8)
+        else:
+            self.premultiplied = rgba[:, :, :3] * alpha + 127
+            self.inverse_alpha = 255 - alpha
+
+    def blend(self, frame):
+        region = frame[self.y0:self.y1, self.x0:self.x1]
+        if self.opaque:
+            region[:] = self.rgb
+        else:
+            region[:] = (self.premultiplied + region * self.inverse_alpha) // 255
+
+
+class CaptionCompositor:
+    """
+    Draws the podcast chrome (title, LIVE badge) and the active subtitle on
+    top of background frames.
+
+    Fonts are loaded and the static chrome is rendered once per compositor;
+    each subtitle block is rendered once when its segment first appears.
+    Per-frame work is only blending the cached layers.
+    """
+
+    # Subtitles are shown in order, so only the latest few need to stay cached
+    MAX_CACHED_CAPTIONS = 4
+
+    def __init__(self, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+        self.width = width
+        self.height = height
+        self.scale = height / FRAME_HEIGHT
+
+        self.title_font = load_font("arial.ttf", self._px(50))
+        self.live_font = load_font("arialbd.ttf", self._px(35))
+        self.bullet_font = load_font("arialbd.ttf", self._px(45))
+        self.speaker_font = load_font("arialbd.ttf", self._px(38))
+
+        self._chrome = self._render_chrome()
+        self._captions = OrderedDict()
+
+    def compose(self, frame, caption=None):
+        """
+        Blends the chrome and, if given, the subtitle `caption` onto
+        `frame` in place.
+        """
+        self._chrome.blend(frame)
+        if caption is not None:
+            self._caption_layer(caption).blend(frame)
+        return frame
+
+    def _px(self, value):
+        return round(value * self.scale)
+
+    def _new_canvas(self):
+        image = Image.new("RGBA", (self.width, self.height), (0, 0, 0, 0))
+        return image, ImageDraw.Draw(image)
+
+    def _render_chrome(self):
+        image, draw = self._new_canvas()
+        w = self.width
+        px = self._px
+
+        # Boxes were always drawn opaque on the RGB frame, so keep them opaque here
+        title_bbox = draw.textbbox((0, 0), TITLE_TEXT, font=self.title_font)
+        title_width = title_bbox[2] - title_bbox[0]
+        title_x = (w - title_width) // 2
+        draw.rectangle([title_x - px(20), px(20), title_x + title_width + px(20), px(100)], fill=(0, 0, 0, 255))
+        draw.text((title_x, px(30)), TITLE_TEXT, fill=(255, 255, 255), font=self.title_font)
+
+        draw.rectangle([px(20), px(20), px(180), px(80)], fill=(0, 0, 0, 255))
+        draw.text((px(30), px(30)), "● LIVE", fill=(239, 68, 68), font=self.live_font)
+
+        return Layer(image)
+
+    def _caption_layer(self, caption):
+        layer = self._captions.get(caption.index)
+        if layer is not None:
+            self._captions.move_to_end(caption.index)
+            return layer
+
+        layer = self._render_caption(caption)
+        self._captions[caption.index] = layer
+        if len(self._captions) > self.MAX_CACHED_CAPTIONS:
+            self._captions.popitem(last=False)
+        return layer
+
+    def _render_caption(self, caption):
+        image, draw = self._new_canvas()
+        w = self.width
+        px = self._px
+        color, icon = SPEAKER_STYLES.get(caption.speaker, SPEAKER_STYLES['Host B'])
+
+        draw.rectangle([px(80), px(680), px(400), px(740)], fill=(0, 0, 0, 255))
+        draw.text((px(100), px(690)), f"{icon} {caption.speaker}", fill=(255, 255, 255), font=self.speaker_font)
+
+        draw.rectangle([px(80), px(760), w - px(80), px(950)], fill=(15, 23, 42, 255))
+        y_offset = px(780)
+        for line in caption.lines:
+            draw.text((px(100), y_offset), line, fill=color, font=self.bullet_font)
+            y_offset += px(60)
+
+        return Layer(image)
+
+
+class PodcastFrames:
+    """
+    Produces finished video frames for a podcast: a black intro and outro
+    around the animated background with chrome and captions on top.
+
+    With `captions` off the subtitles are left to the player, and with
+    `animated` off every content frame is the same still image.
+
+    The renderers are built lazily and dropped when pickled, so a worker
+    process can rebuild its own copy from the timing map alone.
+    """
+
+    def __init__(self, segments, duration, intro_duration=2, outro_duration=2,
+                 width=FRAME_WIDTH, height=FRAME_HEIGHT, background_cache=None,
+                 captions=True, animated=True):
+        self.segments = segments
+        self.duration = duration
+        self.intro_duration = intro_duration
+        self.outro_duration = outro_duration
+        self.width = width
+        self.height = height
+        self.background_cache = background_cache
+        self.captions = captions
+        self.animated = animated
+        self._background = None
+        self._compositor = None
+        self._subtitles = None
+        self._still = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_background=None, _compositor=None, _subtitles=None, _still=None)
+        return state
+
+    @property
+    def content_end(self):
+        return self.duration - self.outro_duration
+
+    @property
+    def subtitles(self):
+        if self._subtitles is None:
+            # Segment times are relative to the audio, which starts after the intro
+            self._subtitles = SubtitleIndex(self.segments, offset=self.intro_duration)
+        return self._subtitles
+
+    def extend(self, segments):
+        """
+        Adds captions for segments timed after the existing ones, e.g. while
+        the rest of the audio is still being generated.
+        """
+        self.segments = list(self.segments) + list(segments)
+        self._subtitles = None
+
+    def caption_boundaries(self):
+        """
+        Times (in video time) at which the caption on screen changes.
+        """
+        times = {self.intro_duration, self.content_end}
+        for caption in self.subtitles.captions:
+            times.add(caption.start)
+            times.add(caption.end)
+        return sorted(t for t in times if 0 < t < self.duration)
+
+    def frame(self, t):
+        # Show blank screen during intro and outro
+        if t < self.intro_duration or t >= self.content_end:
+            return np.zeros((self.height, self.width, 3), dtype=np.uint8)
+
+        if self._background is None:
+            self._background = BackgroundRenderer(self.width, self.height, self.background_cache)
+            self._compositor = CaptionCompositor(self.width, self.height)
+
+        if not self.animated:
+            if self._still is None:
+                self._still = self._compositor.compose(self._background.render(0))
+            return self._still
+
+        frame = self._background.render(t - self.intro_duration)
+        return self._compositor.compose(frame, self.subtitles.at(t) if self.captions else None)
@@ -0,0 +1,74 @@
+import math
+import os
+
+
+def _timestamp(seconds, separator):
+    milliseconds = max(0, round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def _cues(segments, offset):
+    for segment in sorted(segments, key=lambda segment: segment['start']):
+        text = ' '.join(segment['text'].split())
+        if text and segment['end'] > segment['start']:
+            yield segment['start'] + offset, segment['end'] + offset, segment['speaker'], text
+
+
+def to_webvtt(segments, offset=0, hls=False):
+    """
+    A timing map as WebVTT, with the speaker as each cue's voice. Segment
+    times are relative to the audio, which starts `offset` seconds in.
+    With `hls` the cue times are mapped onto the timeline of HLS segments.
+    """
+    blocks = ["WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000\n" if hls else "WEBVTT\n"]
+    for start, end, speaker, text in _cues(segments, offset):
+        text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        blocks.append(f"{_timestamp(start, '.')} --> {_timestamp(end, '.')}\n<v {speaker}>{text}\n")
+    return '\n'.join(blocks)
+
+
+def to_srt(segments, offset=0):
+    """
+    A timing map as SubRip, with the speaker in front of each line.
+    """
+    blocks = []
+    for number, (start, end, speaker, text) in enumerate(_cues(segments, offset), 1):
+        blocks.append(f"{number}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{speaker}: {text}\n")
+    return '\n'.join(blocks)
+
+
+def write_sidecars(segments, video_path, offset=0):
+    """
+    Writes the .vtt and .srt files next to `video_path` and returns their paths.
+    """
+    base = os.path.splitext(video_path)[0]
+    paths = (f"{base}.vtt", f"{base}.srt")
+    for path, text in zip(paths, (to_webvtt(segments, offset), to_srt(segments, offset))):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return paths
+
+
+def write_hls_captions(segments, directory, duration, offset=0):
+    """
+    Writes the captions as a one-segment WebVTT subtitle playlist in
+    `directory` (see video.write_master_playlist) and returns its path.
+    """
+    with open(os.path.join(directory, 'captions.vtt'), 'w', encoding='utf-8') as f:
+        f.write(to_webvtt(segments, offset, hls=True))
+    path = os.path.join(directory, 'captions.m3u8')
+    with open(path, 'w') as f:
+        f.write('\n'.join([
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f"#EXT-X-TARGETDURATION:{math.ceil(duration)}",
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            '#EXT-X-PLAYLIST-TYPE:VOD',
+            f"#EXTINF:{duration:.3f},",
+            'captions.vtt',
+            '#EXT-X-ENDLIST',
+        ]) + '\n')
+    return path
@@ -0,0 +1,113 @@
+import asyncio
+
+from .cache import cache_key
+
+# Frame header for MPEG-2 Layer III, 48 kbps, 24 kHz, mono: the format Edge TTS returns
+SILENT_FRAME_HEADER = bytes([0xFF, 0xF3, 0x64, 0xC0])
+SILENT_FRAME_SIZE = 144
+SILENT_FRAME_DURATION = 576 / 24000
+
+
+class EdgeTTSProvider:
+    """
+    Synthesizes speech with Microsoft Edge TTS, returning the MP3 bytes.
+    """
+
+    name = 'edge'
+
+    def __init__(self, rate='+0%', volume='+0%', pitch='+0Hz'):
+        self.params = {'rate': rate, 'volume': volume, 'pitch': pitch}
+
+    async def synthesize(self, text, voice):
+        import edge_tts
+
+        communicate = edge_tts.Communicate(text, voice, **self.params)
+        audio = bytearray()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio += chunk["data"]
+        return bytes(audio)
+
+
+class StubTTSProvider:
+    """
+    Offline provider that returns silent MP3 audio, lasting as long as the
+    text would take to read at 150 words per minute. Used for tests and
+    benchmarks; `latency` simulates the round trip of a real service.
+    """
+
+    name = 'stub'
+
+    def __init__(self, latency=0.0, words_per_second=2.5):
+        self.latency = latency
+        self.params = {'words_per_second': words_per_second}
+
+    async def synthesize(self, text, voice):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        seconds = max(1, len(text.split())) / self.params['words_per_second']
+        frame = SILENT_FRAME_HEADER + bytes(SILENT_FRAME_SIZE - len(SILENT_FRAME_HEADER))
+        return frame * max(1, round(seconds / SILENT_FRAME_DURATION))
+
+
+PROVIDERS = {
+    EdgeTTSProvider.name: EdgeTTSProvider,
+    StubTTSProvider.name: StubTTSProvider,
+}
+
+
+def get_provider(name, **options):
+    try:
+        return PROVIDERS[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown TTS provider: {name}")
+
+
+def segment_key(provider, text, voice):
+    """
+    Cache key for one synthesized segment: everything that affects the audio.
+    """
+    return cache_key('tts', provider.name, voice, text, provider.params)
+
+
+async def synthesize_with_retry(provider, text, voice, retries=3, backoff=1.0):
+    """
+    Synthesizes one segment, retrying failures with exponential backoff.
+    """
+    for attempt in range(retries + 1):
+        try:
+            audio = await provider.synthesize(text, voice)
+            if not audio:
+                raise Exception("No audio received")
+            return audio
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"TTS attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def synthesize_segments(provider, segments, concurrency=8, retries=3, backoff=1.0,
+                              on_result=None):
+    """
+    Synthesizes all segments concurrently, at most `concurrency` at a time.
+
+    Returns one result per segment in script order: the MP3 bytes, or the
+    exception that made the segment fail after all retries. If given,
+    `on_result(index, result)` is called as soon as each segment finishes.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def synthesize(index, segment):
+        async with semaphore:
+            try:
+                result = await synthesize_with_retry(provider, segment['text'], segment['voice'],
+                                                     retries=retries, backoff=backoff)
+            except Exception as e:
+                result = e
+        if on_result:
+            on_result(index, result)
+        return result
+
+    return await asyncio.gather(*(synthesize(i, segment) for i, segment in enumerate(segments)))
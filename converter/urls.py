@@ -5,4 +5,6 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('api/start/', views.start_conversion, name='start_conversion'),
     path('api/status/<uuid:task_id>/', views.get_status, name='get_status'),
+    path('api/events/<uuid:task_id>/', views.task_events, name='task_events'),
+    path('api/retry/<uuid:task_id>/', views.retry_conversion, name='retry_conversion'),
 ]
@@ -1,53 +1,32 @@
-import os
-import requests
-from bs4 import BeautifulSoup
-import google.generativeai as genai
-import uuid
+import re
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 
+from .cache import cache_key, get_cache
+from .dedup import content_hash
+from .extract import extract_text
+from .fetch import fetch
+from .llm import FRAME_SEPARATOR_HINT, get_backend
+
 def fetch_blog_content(url):
     """
     Fetches and extracts text content from a blog URL.
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-            
-        # Get text
-        text = soup.get_text()
-        
-        # Break into lines and remove leading/trailing space on each
-        lines = (line.strip() for line in text.splitlines())
-        # Break multi-headlines into a line each
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        # Drop blank lines
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        return text
+        # Pooled connections, conditional revalidation and a body size limit
+        html = fetch(url)
+        # Keep only the article body, without navigation, comments and the like
+        return extract_text(html)
     except Exception as e:
         print(f"Error fetching blog content: {e}")
         raise e
 
-def generate_podcast_script(text):
-    """
-    Generates a podcast script from the given text using Google Gemini.
-    """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables")
-        
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    prompt = f"""
+# Bump whenever a prompt changes, so scripts cached for the old one are not reused
+PROMPT_VERSION = 2
+
+
+def build_prompt(text):
+    return f"""
     You are an expert podcast script writer. Convert the following blog post content into an engaging, conversational podcast script between two hosts (Host A and Host B).
     
     STRICT FORMATTING RULES:
@@ -62,6 +41,137 @@ def generate_podcast_script(text):
     
     Podcast Script:
     """
+
+
+def split_sections(text, max_chars):
+    """
+    Splits text into sections of at most `max_chars`, at paragraph breaks
+    where possible and at sentence ends otherwise.
+    """
+    pieces = []
+    for paragraph in text.split('\n'):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        sentence_pieces = re.split(r'(?<=[.!?])\s+', paragraph)
+        pieces += [sentence[i:i + max_chars] for sentence in sentence_pieces
+                   for i in range(0, len(sentence), max_chars)]
+
+    sections = []
+    current = ''
+    for piece in pieces:
+        if not piece:
+            continue
+        if current and len(current) + 1 + len(piece) > max_chars:
+            sections.append(current)
+            current = ''
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        sections.append(current)
+    return sections
+
+
+def build_section_prompt(section, index, count):
+    position = "the opening" if index == 0 else "the end" if index == count - 1 else "the middle"
+    return f"""
+    You are an expert podcast script writer. Two hosts (Host A and Host B) are discussing a long blog post, one part at a time. This is part {index + 1} of {count}, from {position} of the post. Write their conversation about this part only.
+    
+    STRICT FORMATTING RULES:
+    1. Every line of dialogue MUST start with exactly "Host A:" or "Host B:".
+    2. Do not use "Host A says" or other variations.
+    3. Do not include stage directions or sound effects.
+    4. Cover every key point of this part in about 6-10 lines of dialogue.
+    5. Do not greet the listeners or say goodbye; the conversation is already under way and continues after this part.
+
+    Part Content:
+    {section}
+    
+    Podcast Script:
+    """
+
+
+def build_frame_prompt(outline):
+    return f"""
+    You are an expert podcast script writer. Write the opening and the closing of a podcast episode in which two hosts (Host A and Host B) discuss a blog post with the outline below.
     
-    response = model.generate_content(prompt)
-    return response.text
+    STRICT FORMATTING RULES:
+    1. Every line of dialogue MUST start with exactly "Host A:" or "Host B:".
+    2. The opening welcomes the listeners and introduces the topic in 2-4 lines.
+    3. The closing sums up and says goodbye in 2-4 lines.
+    4. Separate the opening and the closing with {FRAME_SEPARATOR_HINT}.
+
+    Outline Content:
+    {outline}
+    
+    Podcast Script:
+    """
+
+
+# A line of dialogue: "Host A: ..." or with a stage direction, "Host B (laughing): ..."
+SPEAKER_LINE = re.compile(r'Host ([AB])(?::| \()')
+
+
+def dialogue_lines(text):
+    return [line.strip() for line in text.splitlines() if SPEAKER_LINE.match(line.strip())]
+
+
+def write_chunked_script(backend, text, section_chars, concurrency):
+    """
+    Map-reduce script writing for long articles. Every section is scripted,
+    together with the episode's opening and closing, in one round of
+    concurrent calls, and the results are joined in order. The latency is
+    that of a single call however long the article is.
+    """
+    sections = split_sections(text, section_chars)
+    # The outline is each section's first line, which is usually a heading or topic sentence
+    outline = '\n'.join(section.split('\n', 1)[0][:200] for section in sections)
+    prompts = [build_frame_prompt(outline)]
+    prompts += [build_section_prompt(section, i, len(sections)) for i, section in enumerate(sections)]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        frame, *parts = pool.map(backend.generate, prompts)
+
+    opening, _, closing = (re.split(r'^\s*(---)\s*$', frame, maxsplit=1, flags=re.M) + ['', ''])[:3]
+    lines = dialogue_lines(opening)
+    for part in parts:
+        lines += dialogue_lines(part)
+    lines += dialogue_lines(closing)
+    return '\n'.join(lines)
+
+
+def generate_podcast_script(text):
+    """
+    Generates a podcast script from the given text with the configured LLM
+    backend (Google Gemini by default). Articles longer than
+    SCRIPT_SECTION_CHARS are scripted section by section in parallel.
+
+    Scripts are cached on disk by content, prompt version and model, so the
+    same article is only sent to the model once.
+    """
+    backend = get_backend(getattr(settings, 'LLM_BACKEND', 'gemini'),
+                          **getattr(settings, 'LLM_BACKEND_OPTIONS', {}))
+    section_chars = getattr(settings, 'SCRIPT_SECTION_CHARS', 8000)
+    mode = getattr(settings, 'SCRIPT_MODE', 'auto')
+    chunked = mode == 'chunked' or (mode == 'auto' and len(text) > section_chars)
+
+    cache = None
+    if getattr(settings, 'SCRIPT_CACHE_DIR', None):
+        cache = get_cache(settings.SCRIPT_CACHE_DIR, settings.SCRIPT_CACHE_MAX_BYTES)
+        key = cache_key('script', content_hash(text), PROMPT_VERSION, backend.name, backend.model,
+                        f'chunked:{section_chars}' if chunked else 'single')
+        entry = cache.get(key)
+        stats = f"hit rate {cache.hits / (cache.hits + cache.misses):.0%}"
+        if entry:
+            print(f"Script cache hit ({stats})")
+            return entry[0].decode('utf-8')
+        print(f"Script cache miss ({stats})")
+
+    if chunked:
+        script = write_chunked_script(backend, text, section_chars,
+                                      getattr(settings, 'LLM_CONCURRENCY', 4))
+    else:
+        script = backend.generate(build_prompt(text))
+    if cache and script:
+        cache.set(key, script.encode('utf-8'), {'model': backend.model, 'prompt_version': PROMPT_VERSION})
+    return script
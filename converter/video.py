@@ -0,0 +1,588 @@
+import bisect
+import math
+import multiprocessing
+import os
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from moviepy.config import FFMPEG_BINARY
+
+DEFAULT_ENCODER_OPTIONS = {
+    'codec': 'libx264',
+    'preset': 'medium',
+    'crf': None,          # constant quality; takes precedence over bitrate
+    'bitrate': '5000k',
+    'threads': None,      # None lets the encoder decide
+    'audio_codec': 'copy', # muxes the MP3 stream as is where the container allows
+}
+
+# Containers that can carry the podcast MP3 without re-encoding it. HLS
+# players expect AAC in fMP4 segments, so a playlist output gets AAC.
+MP3_CONTAINERS = ('.mp4', '.m4v', '.mov', '.mkv')
+
+
+def run_ffmpeg(args):
+    """
+    Runs ffmpeg with the given arguments, raising with its error output on failure.
+    """
+    result = subprocess.run([FFMPEG_BINARY, '-y', '-loglevel', 'error', *args],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+
+
+def video_codec_args(codec='libx264', preset='medium', crf=None, bitrate=None, threads=None, **_):
+    args = ['-c:v', codec]
+    if preset:
+        args += ['-preset', preset]
+    if crf is not None:
+        args += ['-crf', str(crf)]
+    elif bitrate:
+        args += ['-b:v', bitrate]
+    if threads:
+        args += ['-threads', str(threads)]
+    return args + ['-pix_fmt', 'yuv420p']
+
+
+def hls_args(playlist_path, segment_seconds=4):
+    """
+    Output arguments that write fMP4 segments next to `playlist_path` and
+    rewrite the playlist after each one, so players can start on the
+    first segment while the rest is still being encoded.
+    """
+    directory = os.path.dirname(playlist_path)
+    return [
+        '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'event',
+        '-hls_segment_type', 'fmp4', '-hls_flags', 'independent_segments',
+        '-hls_segment_filename', os.path.join(directory, 'segment_%05d.m4s'),
+    ]
+
+
+def output_audio_codec(audio_codec, *output_paths):
+    """
+    `audio_codec`, or AAC where it is 'copy' but one of `output_paths` is a
+    container the MP3 cannot be copied into.
+    """
+    if audio_codec == 'copy' and any(os.path.splitext(path)[1].lower() not in MP3_CONTAINERS
+                                     for path in output_paths):
+        return 'aac'
+    return audio_codec
+
+
+def audio_args(audio_path, audio_offset=0, audio_codec='copy', **_):
+    """
+    Input and codec arguments that add `audio_path` as the second input,
+    starting `audio_offset` seconds into the video.
+    """
+    if audio_codec == 'copy':
+        # A stream copy cannot be filtered, so shift its timestamps instead
+        return ['-itsoffset', f'{audio_offset:.3f}', '-i', audio_path], ['-c:a', 'copy']
+    return ['-i', audio_path], ['-af', f'adelay={int(audio_offset * 1000)}:all=1', '-c:a', audio_codec]
+
+
+class FFmpegWriter:
+    """
+    Streams raw RGB frames into an ffmpeg process over a pipe, optionally
+    muxing an audio file into the same output. An output path ending in
+    .m3u8 is written as a live HLS playlist (see `hls_args`).
+
+    Each of `renditions` (dicts with a 'path', 'width' and 'height' and
+    optionally 'fps' and encoder options) is a further output of the same
+    process, scaled down from the piped frames, so every frame is produced
+    and sent once however many sizes are encoded.
+
+    `keyframe_seconds` forces keyframes at that interval, so the output can
+    be cut into HLS segments of that length later.
+    """
+
+    def __init__(self, output_path, width, height, fps, audio_path=None, audio_offset=0,
+                 duration=None, renditions=(), hls_segment_seconds=4, keyframe_seconds=None, **options):
+        options = {**DEFAULT_ENCODER_OPTIONS, **options}
+        self.frame_size = width * height * 3
+        if output_path.endswith('.m3u8'):
+            keyframe_seconds = hls_segment_seconds
+
+        inputs = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
+                  '-r', str(fps), '-i', '-']
+        audio_outputs = None
+        if audio_path:
+            # Every output shares the audio input, so one that cannot hold the MP3 re-encodes it for all
+            options['audio_codec'] = output_audio_codec(
+                options['audio_codec'], output_path, *(rendition['path'] for rendition in renditions))
+            audio_inputs, audio_outputs = audio_args(audio_path, audio_offset, **options)
+            inputs += audio_inputs
+
+        def output_args(path, video, extra, options):
+            outputs = ['-map', video]
+            if audio_outputs:
+                outputs += ['-map', '1:a']
+            outputs += extra + video_codec_args(**options) + (audio_outputs or [])
+            if duration is not None:
+                outputs += ['-t', f'{duration:.3f}']
+            if keyframe_seconds:
+                # Keyframes on the segment boundaries, so every segment starts cleanly
+                outputs += ['-force_key_frames', f'expr:gte(t,n_forced*{keyframe_seconds})']
+            if path.endswith('.mp4'):
+                outputs += ['-movflags', '+faststart']
+            elif path.endswith('.m3u8'):
+                outputs += hls_args(path, hls_segment_seconds)
+            return outputs + [path]
+
+        if not renditions:
+            outputs = output_args(output_path, '0:v', [], options)
+        else:
+            # Convert the frames to YUV once, then split them between the outputs
+            labels = [f'[v{i}]' for i in range(len(renditions) + 1)]
+            graph = [f"[0:v]format=yuv420p,split={len(labels)}{''.join(labels)}"]
+            outputs = output_args(output_path, labels[0], [], options)
+            for i, rendition in enumerate(renditions, 1):
+                rendition = {**options, **rendition}
+                graph.append(f"{labels[i]}scale={rendition.pop('width')}:{rendition.pop('height')}[s{i}]")
+                extra = ['-r', str(rendition.pop('fps'))] if rendition.get('fps') else []
+                outputs += output_args(rendition.pop('path'), f'[s{i}]', extra, rendition)
+            inputs += ['-filter_complex', ';'.join(graph)]
+
+        self.process = subprocess.Popen(
+            [FFMPEG_BINARY, '-y', '-loglevel', 'error', *inputs, *outputs],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            self.close()
+
+    def close(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        error = self.process.stderr.read().decode(errors='replace')
+        self.process.stderr.close()
+        if self.process.wait() != 0:
+            raise Exception(f"ffmpeg failed: {error.strip()[-500:]}")
+
+    def abort(self):
+        self.process.kill()
+        self.process.wait()
+        self.process.stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def iter_frames(frames, start_frame, end_frame, fps):
+    for index in range(start_frame, end_frame):
+        yield frames.frame(index / fps)
+
+
+def encode_ffmpeg(frames, output_path, start_frame, end_frame, fps, audio_path=None, **options):
+    """
+    Encodes frames [start_frame, end_frame) by piping them straight to ffmpeg.
+    """
+    audio_offset = frames.intro_duration if audio_path else 0
+    duration = (end_frame - start_frame) / fps
+    with FFmpegWriter(output_path, frames.width, frames.height, fps, audio_path=audio_path,
+                      audio_offset=audio_offset, duration=duration, **options) as writer:
+        for frame in iter_frames(frames, start_frame, end_frame, fps):
+            writer.write(frame)
+
+
+def encode_moviepy(frames, output_path, start_frame, end_frame, fps, audio_path=None, **options):
+    """
+    Encodes frames [start_frame, end_frame) through MoviePy's clip writer.
+    """
+    from moviepy import AudioFileClip, VideoClip
+
+    options = {**DEFAULT_ENCODER_OPTIONS, **options}
+
+    def make_frame(t):
+        return frames.frame((start_frame + round(t * fps)) / fps)
+
+    # Half a frame of slack so MoviePy's int(duration * fps) cannot round down
+    clip = VideoClip(make_frame, duration=(end_frame - start_frame + 0.5) / fps)
+    audio_clip = None
+    if audio_path:
+        # Add audio (offset by intro duration)
+        audio_clip = AudioFileClip(audio_path)
+        clip = clip.with_audio(audio_clip.with_start(frames.intro_duration))
+
+    ffmpeg_params = ['-crf', str(options['crf'])] if options['crf'] is not None else None
+    audio_codec = 'aac' if options['audio_codec'] == 'copy' else options['audio_codec']
+    try:
+        clip.write_videofile(
+            output_path, fps=fps, codec=options['codec'], preset=options['preset'],
+            bitrate=None if ffmpeg_params else options['bitrate'], threads=options['threads'],
+            ffmpeg_params=ffmpeg_params, audio=bool(audio_path), audio_codec=audio_codec,
+            temp_audiofile=f"{os.path.splitext(output_path)[0]}_audio.m4a",
+            remove_temp=True, logger=None,
+        )
+    finally:
+        clip.close()
+        if audio_clip:
+            audio_clip.close()
+
+
+ENCODERS = {
+    'ffmpeg': encode_ffmpeg,
+    'moviepy': encode_moviepy,
+}
+
+
+def split_timeline(total_frames, fps, boundaries, chunks):
+    """
+    Splits frames [0, total_frames) into at most `chunks` contiguous ranges of
+    similar length, cutting at the boundary time closest to each even split.
+    """
+    cuts = sorted({round(t * fps) for t in boundaries} - {0})
+    cuts = [cut for cut in cuts if cut < total_frames]
+
+    chosen = set()
+    for k in range(1, chunks):
+        ideal = total_frames * k / chunks
+        if cuts:
+            i = bisect.bisect_left(cuts, ideal)
+            chosen.add(min(cuts[max(i - 1, 0):i + 1], key=lambda cut: abs(cut - ideal)))
+        else:
+            chosen.add(round(ideal))
+
+    edges = [0] + sorted(cut for cut in chosen if 0 < cut < total_frames) + [total_frames]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def render_chunk(encoder, frames, start_frame, end_frame, fps, path, options):
+    """
+    Encodes frames [start_frame, end_frame) of `frames` to a video-only file.
+    """
+    ENCODERS[encoder](frames, path, start_frame, end_frame, fps, **options)
+    return path
+
+
+def join_chunks(chunk_paths, audio_path, output_path, duration, audio_offset=0, **options):
+    """
+    Concatenates encoded chunks without re-encoding them and muxes in the audio,
+    delayed by `audio_offset` seconds.
+    """
+    list_path = f"{os.path.splitext(output_path)[0]}_parts.txt"
+    with open(list_path, 'w') as f:
+        for path in chunk_paths:
+            escaped = os.path.abspath(path).replace("'", r"'\''")
+            f.write(f"file '{escaped}'\n")
+
+    audio_codec = output_audio_codec(options.get('audio_codec', DEFAULT_ENCODER_OPTIONS['audio_codec']),
+                                     output_path)
+    audio_inputs, audio_outputs = audio_args(audio_path, audio_offset, audio_codec)
+    try:
+        run_ffmpeg([
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            *audio_inputs,
+            '-map', '0:v', '-map', '1:a',
+            '-c:v', 'copy',
+            *audio_outputs,
+            '-t', f'{duration:.3f}',
+            '-movflags', '+faststart',
+            output_path,
+        ])
+    finally:
+        os.remove(list_path)
+
+
+def mux_subtitles(video_path, subtitle_path, language='eng'):
+    """
+    Replaces the subtitle track of `video_path` with `subtitle_path` (SRT or
+    WebVTT) as an mp4 text track. Audio and video are copied, not re-encoded.
+    """
+    temp_path = f"{os.path.splitext(video_path)[0]}_subtitled.mp4"
+    try:
+        run_ffmpeg([
+            '-i', video_path, '-i', subtitle_path,
+            '-map', '0:v', '-map', '0:a?', '-map', '1:s',
+            '-c', 'copy', '-c:s', 'mov_text', '-metadata:s:s:0', f'language={language}',
+            '-movflags', '+faststart',
+            temp_path,
+        ])
+        os.replace(temp_path, video_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def segment_hls(video_path, playlist_path, segment_seconds=4, source_audio_codec='copy'):
+    """
+    Cuts a finished video into an HLS playlist without re-encoding its video.
+    Segments can only start on keyframes, so they may run longer.
+    `source_audio_codec` is the codec the video's audio was written with; a
+    copied MP3 is re-encoded to AAC for the segments.
+    """
+    audio_codec = 'aac' if source_audio_codec == 'copy' else 'copy'
+    run_ffmpeg(['-i', video_path, '-map', '0:v', '-map', '0:a?', '-c:v', 'copy', '-c:a', audio_codec,
+                *hls_args(playlist_path, segment_seconds), playlist_path])
+
+
+def segment_chunk(video_path, audio_path, playlist_path, index, start, duration, audio_offset=0,
+                  segment_seconds=4):
+    """
+    Cuts one video-only chunk of a parallel render into HLS segments next to
+    `playlist_path`, with the audio from `start` to `start + duration` (in
+    video time) encoded as AAC. Returns the chunk's own playlist path.
+    """
+    directory = os.path.dirname(playlist_path)
+    part_path = os.path.join(directory, f"part_{index:03d}.m3u8")
+    audio = (f"[1:a]adelay={int(audio_offset * 1000)}:all=1,apad,"
+             f"atrim=start={start:.3f}:duration={duration:.3f},asetpts=PTS-STARTPTS[a]")
+    run_ffmpeg([
+        '-i', video_path, '-i', audio_path, '-filter_complex', audio,
+        '-map', '0:v', '-map', '[a]', '-c:v', 'copy', '-c:a', 'aac',
+        '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', f"init_{index:03d}.mp4",
+        '-hls_segment_filename', os.path.join(directory, f"part_{index:03d}_%05d.m4s"),
+        part_path,
+    ])
+    return part_path
+
+
+class HlsPlaylist:
+    """
+    A live HLS playlist assembled from separately segmented parts, such as
+    the chunks of a parallel render. Each part keeps its own init segment
+    and is marked as a discontinuity, and the playlist is replaced
+    atomically on every update so players never read half of it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.parts = []
+
+    def append(self, part_path):
+        lines = []
+        with open(part_path) as f:
+            for line in f.read().splitlines():
+                if line.startswith(('#EXT-X-MAP', '#EXTINF')) or (line and not line.startswith('#')):
+                    lines.append(line)
+        self.parts.append(lines)
+        self._write(ended=False)
+
+    def close(self):
+        self._write(ended=True)
+
+    def _write(self, ended):
+        durations = [float(line[8:].split(',')[0]) for lines in self.parts for line in lines
+                     if line.startswith('#EXTINF:')]
+        text = ['#EXTM3U', '#EXT-X-VERSION:7', f"#EXT-X-TARGETDURATION:{math.ceil(max(durations, default=1))}",
+                '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:EVENT', '#EXT-X-INDEPENDENT-SEGMENTS']
+        for i, lines in enumerate(self.parts):
+            if i:
+                text.append('#EXT-X-DISCONTINUITY')
+            text += lines
+        if ended:
+            text.append('#EXT-X-ENDLIST')
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write('\n'.join(text) + '\n')
+        os.replace(temp_path, self.path)
+
+
+def write_master_playlist(playlist_path, captions_playlist, bitrate=None):
+    """
+    Writes master.m3u8 next to the media playlist `playlist_path`, offering
+    `captions_playlist` (in the same directory) as its subtitle rendition.
+    Returns the master playlist's path.
+    """
+    directory = os.path.dirname(playlist_path)
+    bitrate = str(bitrate or '5000k').lower()
+    bandwidth = int(float(bitrate.rstrip('km')) * {'k': 1000, 'm': 1000000}.get(bitrate[-1], 1))
+    master_path = os.path.join(directory, 'master.m3u8')
+    with open(master_path, 'w') as f:
+        f.write('\n'.join([
+            '#EXTM3U',
+            '#EXT-X-VERSION:7',
+            '#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="Captions",LANGUAGE="en",DEFAULT=YES,'
+            f'AUTOSELECT=YES,URI="{os.path.basename(captions_playlist)}"',
+            f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},SUBTITLES="subs"',
+            os.path.basename(playlist_path),
+        ]) + '\n')
+    return master_path
+
+
+def hls_to_mp4(playlist_path, output_path):
+    """
+    Joins the segments of an HLS playlist into one mp4 without re-encoding them.
+    """
+    run_ffmpeg(['-i', playlist_path, '-c', 'copy', '-movflags', '+faststart', output_path])
+
+
+def chunk_path(path, index):
+    return f"{os.path.splitext(path)[0]}_part{index}.mp4"
+
+
+def render_parallel(frames, audio_path, output_path, workers, fps=30, encoder='ffmpeg', renditions=(),
+                    hls_playlist=None, hls_segment_seconds=4, **options):
+    """
+    Renders `frames` in a pool of worker processes, one chunk of the timeline
+    per worker, and joins the chunks into `output_path` (and each rendition's
+    path) with the audio.
+
+    With an `hls_playlist` path each chunk is also segmented as soon as it
+    and the chunks before it are done, so the playlist grows in timeline
+    order while later chunks are still rendering.
+    """
+    total_frames = int(frames.duration * fps)
+    ranges = split_timeline(total_frames, fps, frames.caption_boundaries(), workers)
+    outputs = [output_path] + [rendition['path'] for rendition in renditions]
+    chunk_paths = [[chunk_path(path, i) for i in range(len(ranges))] for path in outputs]
+
+    # Share the encoder threads between workers instead of oversubscribing
+    chunk_options = dict(options)
+    if not chunk_options.get('threads'):
+        chunk_options['threads'] = max(1, (os.cpu_count() or 1) // workers)
+    playlist = None
+    if hls_playlist:
+        chunk_options['keyframe_seconds'] = hls_segment_seconds
+        playlist = HlsPlaylist(hls_playlist)
+
+    try:
+        # Spawn rather than fork: we are called from a thread of a Django process
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(render_chunk, encoder, frames, start, end, fps, chunk_path(output_path, i), {
+                    **chunk_options,
+                    'renditions': [{**rendition, 'path': chunk_path(rendition['path'], i)}
+                                   for rendition in renditions],
+                })
+                for i, (start, end) in enumerate(ranges)
+            ]
+            for i, future in enumerate(futures):
+                future.result()
+                if playlist:
+                    start, end = ranges[i]
+                    playlist.append(segment_chunk(
+                        chunk_path(output_path, i), audio_path, hls_playlist, i, start / fps, (end - start) / fps,
+                        audio_offset=frames.intro_duration, segment_seconds=hls_segment_seconds))
+        if playlist:
+            playlist.close()
+
+        for path, paths in zip(outputs, chunk_paths):
+            join_chunks(paths, audio_path, path, total_frames / fps,
+                        audio_offset=frames.intro_duration, **options)
+    finally:
+        for path in sum(chunk_paths, []):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def render_video(frames, audio_path, output_path, fps=30, encoder='ffmpeg', workers=1, **options):
+    """
+    Renders `frames` with the audio track into `output_path`, and into the
+    paths of any `renditions` (see FFmpegWriter), in parallel chunks when
+    more than one worker is configured. An .m3u8 `output_path` (one worker)
+    or `hls_playlist` (several) writes a live HLS playlist as it renders.
+    """
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown video encoder: {encoder}")
+    if options.get('renditions') and encoder != 'ffmpeg':
+        raise ValueError("Extra renditions need the ffmpeg encoder")
+
+    if workers > 1:
+        render_parallel(frames, audio_path, output_path, workers, fps=fps, encoder=encoder, **options)
+    else:
+        total_frames = int(frames.duration * fps)
+        ENCODERS[encoder](frames, output_path, 0, total_frames, fps, audio_path=audio_path, **options)
+
+
+class StreamingRenderer:
+    """
+    Renders and encodes a video-only stream in a background thread while the
+    audio is still being generated, so the two overlap.
+
+    `add_segments` extends the timeline as segment durations become known and
+    frames are rendered up to the last point that cannot change any more;
+    `finish` renders the rest once the total duration is known.
+    """
+
+    def __init__(self, frames, output_path, fps=30, **options):
+        self.frames = frames
+        self.output_path = output_path
+        self.fps = fps
+        self.rendered = 0
+        self._target = 0
+        self._pending = []
+        self._duration = None
+        self._stopped = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._writer = FFmpegWriter(output_path, frames.width, frames.height, fps, **options)
+        self._paths = [output_path] + [rendition['path'] for rendition in options.get('renditions', ())]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_segments(self, segments, audio_end):
+        """
+        Adds captions for `segments`; the audio is now known up to `audio_end`.
+        """
+        # Frames before the outro of the shortest possible video are final
+        safe_until = audio_end - self.frames.outro_duration
+        with self._condition:
+            self._pending.extend(segments)
+            self._target = max(self._target, int(safe_until * self.fps))
+            self._condition.notify()
+
+    def finish(self, duration):
+        """
+        Renders the remaining frames of a `duration` second video and closes the file.
+        """
+        with self._condition:
+            self._duration = duration
+            self._target = int(duration * self.fps)
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        if self._error:
+            self._writer.abort()
+            raise self._error
+        self._writer.close()
+
+    def abort(self):
+        with self._condition:
+            self._target = 0
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        self._writer.abort()
+        for path in self._paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while self.rendered >= self._target and not self._stopped:
+                        self._condition.wait()
+                    if self.rendered >= self._target:
+                        return
+                    target = self._target
+                    segments, self._pending = self._pending, []
+                    duration = self._duration
+
+                # Only this thread touches `frames`, so it never sees a half-updated timeline
+                if segments:
+                    self.frames.extend(segments)
+                if duration is not None:
+                    self.frames.duration = duration
+                for index in range(self.rendered, target):
+                    if index >= self._target:
+                        break  # aborted
+                    self._writer.write(self.frames.frame(index / self.fps))
+                    self.rendered = index + 1
+        except Exception as e:
+            self._error = e
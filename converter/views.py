@@ -1,8 +1,14 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
 from django.views.decorators.csrf import csrf_exempt
-from .models import ConversionTask
+from .models import ConversionTask, TaskLogEntry
 from .agents import Orchestrator
+from .checkpoints import prepare_retry
+from .dedup import find_or_create
+from .events import task_stream
 import json
 
 def index(request):
@@ -17,27 +23,97 @@ def start_conversion(request):
             if not blog_url:
                 return JsonResponse({'error': 'URL is required'}, status=400)
 
-            task = ConversionTask.objects.create(url=blog_url)
-            orchestrator = Orchestrator(task.id)
-            orchestrator.start()
+            profile = data.get('profile') or getattr(settings, 'DEFAULT_RENDER_PROFILE', 'full')
+            if profile not in getattr(settings, 'RENDER_PROFILES', {}):
+                return JsonResponse({'error': f"Unknown render profile: {profile}"}, status=400)
 
+            # Identical requests share one task unless `force` asks for a fresh run
+            task, reused = find_or_create(blog_url, force=bool(data.get('force')), profile=profile)
+            if not reused:
+                orchestrator = Orchestrator(task.id)
+                orchestrator.start()
+
+            return JsonResponse({'task_id': task.id, 'reused': reused})
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Invalid method'}, status=405)
+
+@csrf_exempt
+def retry_conversion(request, task_id):
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body or '{}')
+            task = prepare_retry(task_id, from_stage=data.get('from_stage'), profile=data.get('profile'))
+            Orchestrator(task.id).start()
             return JsonResponse({'task_id': task.id})
+        except ConversionTask.DoesNotExist:
+            return JsonResponse({'error': 'Task not found'}, status=404)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Invalid method'}, status=405)
 
+# Fields the status API can return; `logs` is assembled from the task's log entries
+STATUS_FIELDS = ['status', 'progress', 'current_step', 'script', 'audio_file', 'video_file',
+                 'subtitle_file', 'renditions', 'hls_playlist', 'render_profile', 'error_message', 'logs']
+
+
 def get_status(request, task_id):
+    """
+    Task status. `?fields=progress,status` limits the response to those fields
+    and `?log_after=<log_cursor>` returns only log lines newer than a previous
+    response. Responses carry an ETag from the task's version, so unchanged
+    tasks are answered with 304 Not Modified.
+    """
+    fields = request.GET.get('fields')
+    fields = fields.split(',') if fields else STATUS_FIELDS
+    unknown = set(fields) - set(STATUS_FIELDS)
+    if unknown:
+        return JsonResponse({'error': f"Unknown fields: {', '.join(sorted(unknown))}"}, status=400)
     try:
-        task = ConversionTask.objects.get(id=task_id)
-        return JsonResponse({
-            'status': task.status,
-            'progress': task.progress,
-            'current_step': task.current_step,
-            'script': task.script,
-            'audio_file': task.audio_file,
-            'video_file': task.video_file,
-            'error_message': task.error_message,
-            'logs': task.logs
-        })
-    except ConversionTask.DoesNotExist:
+        log_after = int(request.GET.get('log_after', 0))
+    except ValueError:
+        return JsonResponse({'error': 'log_after must be an integer'}, status=400)
+
+    current = ConversionTask.objects.filter(id=task_id).values('version').first()
+    if current is None:
+        return JsonResponse({'error': 'Task not found'}, status=404)
+
+    etag = quote_etag(str(current['version']))
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        columns = [field for field in fields if field != 'logs']
+        if 'logs' in fields and not log_after:
+            columns.append('logs')  # lines logged before TaskLogEntry existed
+        data = ConversionTask.objects.filter(id=task_id).values(*columns).first() if columns else {}
+        if 'logs' in fields:
+            entries = list(TaskLogEntry.objects.filter(task_id=task_id, id__gt=log_after).order_by('id'))
+            data['logs'] = data.get('logs', '') + ''.join(entry.line() for entry in entries)
+            data['log_cursor'] = entries[-1].id if entries else log_after
+        response = JsonResponse(data)
+
+    response['ETag'] = etag
+    # Finished tasks run again when they are retried or promoted, so clients
+    # always revalidate; unchanged tasks still cost only a 304
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def task_events(request, task_id):
+    if not ConversionTask.objects.filter(id=task_id).exists():
         return JsonResponse({'error': 'Task not found'}, status=404)
+    try:
+        # Sent back by the browser when it reconnects
+        last_log_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_log_id = 0
+    response = StreamingHttpResponse(
+        task_stream(task_id, last_log_id,
+                    poll_interval=getattr(settings, 'EVENT_STREAM_POLL_SECONDS', 2),
+                    max_seconds=getattr(settings, 'EVENT_STREAM_MAX_SECONDS', 300)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response